@@ -0,0 +1,82 @@
+"""
+Microbenchmark for link detection in on_message
+
+Compares running every `parse.Regex.find_*` pattern over each message (the old
+behaviour) against the prefiltered single pass of `parse.Regex.scan()`, over a
+synthetic corpus of chat lines where most messages contain no links
+
+Run from the repository root:
+    python benchmarks/bench_link_scan.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import parse  # noqa: E402
+
+MESSAGE_COUNT = 10000
+REPEATS = 5
+
+CHAT = ["lol", "did anyone watch the launch last night?", "brb getting food", "that's what she said",
+        "I can't believe they renamed it again", "ok but hear me out: pineapple on pizza",
+        "who's up for some games later", "the build is broken again :(", "gg", "same",
+        "my cat just knocked over my coffee", "is the bot down or is it just me",
+        "honestly the sequel was better than the original", "can someone review my PR",
+        "the meeting got moved to 3", "nah", "what time is it over there?",
+        "I have been awake for 20 hours and I regret everything"]
+
+LINKS = ["https://www.reddit.com/r/spacex/comments/abc123/starship_update/",
+         "https://old.reddit.com/r/aww/comments/x1y2z3/look_at_this_dog/def4567/",
+         "https://twitter.com/SpaceX/status/1234567890123456789",
+         "https://www.amazon.com/Some-Product-Name/dp/B000000000",
+         "https://www.newegg.com/Product/Product.aspx?Item=N82E16819113497",
+         "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+         "https://en.wikipedia.org/wiki/Python_(programming_language)",
+         "r/spacex", "/r/aww"]
+
+
+def corpus(count, link_rate=0.05, seed=0):
+    """ Creates chat messages, `link_rate` of which contain a link the bot might unfurl """
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        line = rng.choice(CHAT)
+        if rng.random() < link_rate:
+            line = f"{line} {rng.choice(LINKS)}"
+        messages.append(line)
+    return messages
+
+
+def find_all(regex, message):
+    """ The old approach: every pattern, every message """
+    return [regex.find_subreddits(message), regex.find_posts(message), regex.find_comments(message),
+            regex.find_twitter_id(message), regex.find_amazon(message), regex.find_newegg(message)]
+
+
+def main():
+    regex = parse.Regex(None)
+    messages = corpus(MESSAGE_COUNT)
+
+    # Both approaches must find the same links
+    for message in messages:
+        (subreddits, posts, comments, twitter_ids, amazon, newegg) = find_all(regex, message)
+        found = regex.scan(message)
+        assert found.get("subreddit", []) == subreddits
+        assert found.get("post", []) == posts
+        assert found.get("comment", []) == comments
+        assert found.get("twitter_id", []) == twitter_ids
+        assert found.get("amazon", []) == amazon
+        assert found.get("newegg", []) == newegg
+
+    old = min(timeit.repeat(lambda: [find_all(regex, message) for message in messages], number=1, repeat=REPEATS))
+    new = min(timeit.repeat(lambda: [regex.scan(message) for message in messages], number=1, repeat=REPEATS))
+    print(f"{MESSAGE_COUNT} messages, best of {REPEATS}")
+    print(f"find_* per pattern: {old * 1e6 / MESSAGE_COUNT:.2f} us/message")
+    print(f"scan():             {new * 1e6 / MESSAGE_COUNT:.2f} us/message")
+    print(f"Speedup:            {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Microbenchmark for rebuilding a list from its database rows
+
+Compares the old buffer/commit approach, which pads a buffer with `None` and
+does a `del` + `insert` for every element, against `UserList.load()`, which
+sorts the rows once and builds the contents in a single pass. The rows of a
+synthetic 100k element list are fed in the order MySQL returns an unindexed
+table after years of edits (i.e. shuffled) and in `ORDER BY ListIndex` order
+
+Run from the repository root:
+    python benchmarks/bench_list_load.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cogs.listcommands import UserList  # noqa: E402
+
+ELEMENT_COUNT = 100000
+REPEATS = 3
+
+
+def rows(count, seed=0):
+    """ Creates the (index, element) rows of a list, in random order """
+    rng = random.Random(seed)
+    result = [(index, f"Element {index}") for index in range(count)]
+    rng.shuffle(result)
+    return result
+
+
+def buffer_and_commit(rows):
+    """ The old approach: buffer each element into place, then check for gaps """
+    bufferlist = []
+    for (index, element) in rows:
+        if len(bufferlist) <= index:
+            bufferlist.extend([None] * (index - len(bufferlist) + 1))
+        if bufferlist[index] is not None:
+            raise ValueError("There was already an element at index " + str(index))
+        del bufferlist[index]
+        bufferlist.insert(index, element)
+    for (index, element) in enumerate(bufferlist):
+        if element is None:
+            raise ValueError("None value in buffer found at index " + str(index))
+    return bufferlist
+
+
+def load(rows):
+    """ The new approach """
+    userlist = UserList(None, "benchmark")
+    userlist.load(list(rows))
+    return userlist.contents
+
+
+def main():
+    shuffled = rows(ELEMENT_COUNT)
+    ordered = sorted(shuffled)
+
+    # Both approaches must build the same list, and reject gaps and duplicates
+    assert buffer_and_commit(shuffled) == load(shuffled) == load(ordered)
+    for broken in [ordered[:10] + ordered[11:20], ordered[:10] + ordered[9:20]]:
+        try:
+            load(broken)
+            raise AssertionError("Broken rows were accepted")
+        except ValueError:
+            pass
+
+    old = min(timeit.repeat(lambda: buffer_and_commit(shuffled), number=1, repeat=REPEATS))
+    new = min(timeit.repeat(lambda: load(shuffled), number=1, repeat=REPEATS))
+    new_ordered = min(timeit.repeat(lambda: load(ordered), number=1, repeat=REPEATS))
+    print(f"{ELEMENT_COUNT} elements, best of {REPEATS}")
+    print(f"buffer/commit (shuffled rows): {old * 1000:.1f} ms")
+    print(f"load()        (shuffled rows): {new * 1000:.1f} ms")
+    print(f"load()        (ordered rows):  {new_ordered * 1000:.1f} ms")
+    print(f"Speedup:                       {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
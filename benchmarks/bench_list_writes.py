@@ -0,0 +1,158 @@
+"""
+Round trip benchmark for the database writes of list edits
+
+Counts the statements sent to the database for each list edit by the old
+statement builders (DELETE/shift/INSERT for move, three UPDATEs through a
+temporary index for swap, one INSERT per element for multiadd, DELETE and a
+bounded shift for remove) and by
+`ListEngine`'s set-based statements. Every statement is also applied to an
+in-memory SQLite copy of the Lists table, and the table is checked against
+the edited `UserList` after each edit, so both approaches are shown to keep
+the database in sync
+
+Run from the repository root:
+    python benchmarks/bench_list_writes.py
+"""
+import os
+import random
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cogs.listcommands import ListEngine, UserList  # noqa: E402
+
+USER_ID = "123456789012345678"
+LIST_ID = "benchmark"
+LIST_LENGTH = 200
+MULTIADD_LENGTH = 20
+EDITS = 200
+
+
+class RecordingQueue:
+    """ Stands in for the WriteQueue, applying each operation to SQLite and counting its round trips """
+    def __init__(self, db):
+        self.db = db
+        self.round_trips = 0
+
+    def put(self, command, data=None):
+        self.put_group([(command, data)])
+
+    def put_many(self, command, rows):
+        if rows:
+            self.put_group([(command, rows, True)])
+
+    def put_group(self, statements):
+        for statement in filter(None, statements):
+            command = statement[0].replace("%s", "?")
+            self.round_trips += 1  # An executemany INSERT is sent as a single multi-row statement
+            if len(statement) == 3:
+                self.db.executemany(command, statement[1])
+            else:
+                self.db.execute(command, statement[1])
+
+
+class FakeBot:
+    def __init__(self, write_queue):
+        self.write_queue = write_queue
+        self.users = {USER_ID: "benchmark"}
+
+
+def old_shift_statement(user_id, list_id, shift, from_rank, to_rank):
+    """ The statement the old edits shifted a block of ranks with """
+    shift_command = 'UPDATE Lists SET ListIndex=ListIndex + %s ' \
+                    'WHERE User=%s AND ID=%s AND ListIndex >= %s AND ListIndex <= %s;'
+    return shift_command, (shift, user_id, list_id, from_rank - 1, to_rank - 1)
+
+
+class OldStatements:
+    """ The statements list edits were written with before they were made set-based """
+    def __init__(self, engine, write_queue):
+        self.engine = engine
+        self.write_queue = write_queue
+
+    def move(self, user_id, list_id, from_rank, to_rank):
+        element = self.engine.user_table[user_id][list_id].contents[to_rank - 1]
+        statements = [("DELETE FROM Lists WHERE User=%s AND ID=%s AND ListIndex=%s", (user_id, list_id, from_rank - 1))]
+        if from_rank > to_rank:
+            statements.append(old_shift_statement(user_id, list_id, shift=1, from_rank=to_rank, to_rank=from_rank))
+        else:
+            statements.append(old_shift_statement(user_id, list_id, shift=-1, from_rank=from_rank, to_rank=to_rank))
+        statements.append(("INSERT INTO Lists VALUES (%s, %s, %s, %s)", (user_id, list_id, to_rank - 1, element)))
+        self.write_queue.put_group(statements)
+
+    def swap(self, user_id, list_id, rank1, rank2):
+        update_command = "UPDATE Lists SET ListIndex=%s WHERE User=%s AND ID=%s AND ListIndex=%s"
+        self.write_queue.put_group([(update_command, (-1, user_id, list_id, rank1 - 1)),
+                                    (update_command, (rank1 - 1, user_id, list_id, rank2 - 1)),
+                                    (update_command, (rank2 - 1, user_id, list_id, -1))])
+
+    def remove(self, user_id, list_id, rank):
+        length = len(self.engine.user_table[user_id][list_id]) + 1  # The element has already been removed
+        statements = [("DELETE FROM Lists WHERE User=%s AND ID=%s AND ListIndex=%s", (user_id, list_id, rank - 1))]
+        if rank < length:
+            statements.append(old_shift_statement(user_id, list_id, shift=-1, from_rank=rank + 1, to_rank=length))
+        self.write_queue.put_group(statements)
+
+    def multiadd(self, user_id, list_id, elements):
+        length = len(self.engine.user_table[user_id][list_id])
+        for (i, element) in enumerate(elements):
+            self.write_queue.put("INSERT INTO Lists VALUES (%s, %s, %s, %s)",
+                                 (user_id, list_id, length - len(elements) + i, element))
+
+
+def run(use_old, seed=0):
+    """ Applies random edits to a list, returning the average round trips of each kind of edit """
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE Lists (User TEXT, ID TEXT, ListIndex INTEGER, Element TEXT)")
+    write_queue = RecordingQueue(db)
+    engine = ListEngine(FakeBot(write_queue))
+    old = OldStatements(engine, write_queue)
+    userlist = UserList(None, LIST_ID)
+    engine.user_table[USER_ID] = {LIST_ID: userlist}
+
+    elements = [f"Element {i}" for i in range(LIST_LENGTH)]
+    for element in elements:
+        userlist.add(element)
+    engine.update_list_multiadd(USER_ID, LIST_ID, elements)
+
+    rng = random.Random(seed)
+    round_trips = {"move": [], "swap": [], "multiadd": [], "remove": []}
+    for edit in range(EDITS):
+        kind = rng.choice(sorted(round_trips))
+        before = write_queue.round_trips
+        if kind == "multiadd":
+            added = [f"Added {edit}.{i}" for i in range(MULTIADD_LENGTH)]
+            for element in added:
+                userlist.add(element)
+            (old.multiadd if use_old else engine.update_list_multiadd)(USER_ID, LIST_ID, added)
+        elif kind == "remove":
+            rank = rng.randint(1, len(userlist))
+            userlist.remove(rank)
+            (old.remove if use_old else engine.update_list_remove)(USER_ID, LIST_ID, rank)
+        else:
+            (rank_a, rank_b) = (rng.randint(1, len(userlist)), rng.randint(1, len(userlist)))
+            if kind == "move":
+                userlist.move(rank_a, rank_b)
+                (old.move if use_old else engine.update_list_move)(USER_ID, LIST_ID, rank_a, rank_b)
+            else:
+                userlist.swap(rank_a, rank_b)
+                (old.swap if use_old else engine.update_list_swap)(USER_ID, LIST_ID, rank_a, rank_b)
+        round_trips[kind].append(write_queue.round_trips - before)
+
+        stored = [element for (element,) in db.execute("SELECT Element FROM Lists ORDER BY ListIndex")]
+        assert stored == userlist.contents, f"The database is out of sync after a {kind}"
+    return {kind: sum(counts) / len(counts) for (kind, counts) in round_trips.items()}
+
+
+def main():
+    old = run(use_old=True)
+    new = run(use_old=False)
+    print(f"Round trips per edit, over {EDITS} random edits of a {LIST_LENGTH} element list")
+    print(f"{'Edit':<24}{'Old':>8}{'New':>8}")
+    for kind in sorted(old):
+        label = f"multiadd ({MULTIADD_LENGTH} elements)" if kind == "multiadd" else kind
+        print(f"{label:<24}{old[kind]:>8.1f}{new[kind]:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
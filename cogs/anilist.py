@@ -1,3 +1,4 @@
+import asyncio
 from discord import Embed
 from discord.ext import commands
 from constants import *
@@ -107,7 +108,8 @@ class Anilist:
         self.anime_synonyms = {}
         self.character_synonyms = {}
         self.api_url = 'https://graphql.anilist.co'
-        self.loadsynonyms()
+        self.loaded = asyncio.Event()  # Set once the synonyms have been loaded. Commands wait for it
+        self.bot.loop.create_task(self.loadsynonyms())
 
     @commands.command(pass_context=True, help=LONG_HELP['anime'], brief=BRIEF_HELP['anime'], aliases=ALIASES['anime'])
     async def anime(self, ctx):
@@ -121,6 +123,8 @@ class Anilist:
         """
 
         try:
+            await self.loaded.wait()
+
             # Gets the arguments from the message
             (arguments, searchterm) = parse.args(ctx.message.content)
 
@@ -215,7 +219,7 @@ class Anilist:
                     changefromlist = changefrom.split(";")
                     for element in changefromlist:
                         synonymdict[changeto].append(element.strip())
-                        self.add_synonym(searchtype.upper(), changeto, element)
+                        await self.add_synonym(searchtype.upper(), changeto, element)
                     await self.bot.say("All " + searchtype + " searches for `" + "` or `".join(changefromlist) +
                                        "` will now correct to `" + changeto + "`")
                 else:
@@ -231,7 +235,7 @@ class Anilist:
                     synonymdict[correction].remove(searchterm)
                     if len(synonymdict[correction]) == 0:
                         del synonymdict[correction]
-                    self.remove_synonym(searchtype.upper(), searchterm)
+                    await self.remove_synonym(searchtype.upper(), searchterm)
                     await self.bot.say("Alright, `" + searchterm + "` will no longer correct to `" + correction +
                                        "` for " + searchtype + " searches")
                 else:
@@ -306,23 +310,31 @@ class Anilist:
         except Exception as e:
             await utils.report(self.bot, str(e), source="!anime command", ctx=ctx)
 
-    def loadsynonyms(self):
-        """ Load !anime synonym table from database """
-        query = "SELECT * FROM Synonyms"
-        cursor = self.bot.dbconn.execute(query)
-        for (synonym_type, change_to, change_from) in cursor:
-            change_from = change_from.decode("utf-8")
-            change_to = change_to.decode("utf-8")
-            if synonym_type == "ANIME":
-                if change_to not in self.anime_synonyms.keys():
-                    self.anime_synonyms[change_to] = list()
-                self.anime_synonyms[change_to].append(change_from)
-            elif synonym_type == "CHARACTER":
-                if change_to not in self.character_synonyms.keys():
-                    self.character_synonyms[change_to] = list()
-                self.character_synonyms[change_to].append(change_from)
-
-    def add_synonym(self, synonym_type, change_to, change_from):
+    async def loadsynonyms(self):
+        """ Load !anime synonym table from database. Commands wait until this has finished """
+        try:
+            anime_synonyms = {}
+            character_synonyms = {}
+            query = "SELECT * FROM Synonyms"
+            for (synonym_type, change_to, change_from) in await self.bot.dbconn.fetch(query):
+                change_from = change_from.decode("utf-8")
+                change_to = change_to.decode("utf-8")
+                if synonym_type == "ANIME":
+                    if change_to not in anime_synonyms.keys():
+                        anime_synonyms[change_to] = list()
+                    anime_synonyms[change_to].append(change_from)
+                elif synonym_type == "CHARACTER":
+                    if change_to not in character_synonyms.keys():
+                        character_synonyms[change_to] = list()
+                    character_synonyms[change_to].append(change_from)
+            (self.anime_synonyms, self.character_synonyms) = (anime_synonyms, character_synonyms)
+        except Exception as e:
+            # This can finish after on_ready has reported the loading failures, so it is reported directly
+            await utils.report(self.bot, f"FAILED TO LOAD SYNONYMS\n{type(e).__name__}: {e}", source="loadsynonyms")
+        finally:
+            self.loaded.set()
+
+    async def add_synonym(self, synonym_type, change_to, change_from):
         """ Adds a synonym from the database
 
         Parameters
@@ -336,13 +348,11 @@ class Anilist:
         change_from : str
             The search term which is replaced
         """
-        self.bot.dbconn.ensure_sql_connection()
         add_command = "INSERT INTO Synonyms VALUES (%s, %s, %s)"
         add_data = (synonym_type, change_to, change_from)
-        self.bot.dbconn.execute(add_command, add_data)
-        self.bot.dbconn.commit()
+        await self.bot.dbconn.execute(add_command, add_data)
 
-    def remove_synonym(self, synonym_type, change_from):
+    async def remove_synonym(self, synonym_type, change_from):
         """ Removes a synonym from the database
 
         Parameters
@@ -354,11 +364,9 @@ class Anilist:
         change_from : str
             The search term that will no longer be corrected
         """
-        self.bot.dbconn.ensure_sql_connection()
         delete_command = "DELETE FROM Synonyms WHERE Type=%s AND ChangeFrom=%s"
         delete_data = (synonym_type, change_from)
-        self.bot.dbconn.execute(delete_command, delete_data)
-        self.bot.dbconn.commit()
+        await self.bot.dbconn.execute(delete_command, delete_data)
 
 
 class Anime:
@@ -1,12 +1,18 @@
+from dateutil import tz
 import random
 from discord.ext import commands
 from discord import Embed
-from urllib.parse import quote
 from constants import *
 from credentials import tokens
 import parse
 import utils
-from stringcache import StringCache
+from stringcache import DailyCache, KeyedStringCache, StringCache
+
+UNSPLASH_HEADERS = {
+    "User-Agent": "suitsBot Discord Bot - https://github.com/DWCamp",
+    "Authorization": "Client-ID " + tokens["UNSPLASH_CLIENT_ID"],
+    "Accept-Version": "v1"
+}
 
 
 class Images:
@@ -30,6 +36,12 @@ class Images:
     def __init__(self, bot):
         self.bot = bot
         self.meow_cache = CatCache(bot)
+        self.woof_cache = DogCache(bot)
+        self.picture_cache = KeyedStringCache(bot, UnsplashCache,
+                                              max_caches=UNSPLASH_POOL_MAX_QUERIES,
+                                              promote_after=UNSPLASH_POOL_PROMOTE_AFTER,
+                                              preset_keys=UNSPLASH_POOL_PRESET_QUERIES)
+        bot.loop.create_task(prefetch_apod(bot))
         self.gritty_urls = ["https://media.newyorker.com/photos/5bbd10430cdf452cf93ca22f/master/w_1023,c_limit/Crouch-Gritty.jpg",
                             "https://media.phillyvoice.com/media/images/Dn9LBKjU8AAaIYO.jpg-large.ad646704.fill-735x490.jpg",
                             "https://i.imgflip.com/2imt3r.gif",
@@ -105,11 +117,6 @@ class Images:
         try:
             unsplash_icon = ('https://image.winudf.com/v2/image/Y29tLmFwcHlidWlsZGVyLmFmYXFsZW8xMDIuVW5zcG' +
                              'xhc2hfaWNvbl8xNTMxMTA2MTg5XzA5OQ/icon.png?w=170&fakeurl=1&type=.png')
-            headers = {
-                "User-Agent": "suitsBot Discord Bot - https://github.com/DWCamp",
-                "Authorization": "Client-ID " + tokens["UNSPLASH_CLIENT_ID"],
-                "Accept-Version": "v1"
-            }
 
             # Parse command
             content = parse.stripcommand(ctx.message.content)
@@ -118,13 +125,14 @@ class Images:
             if content == "":
                 query = "snake"
             else:
-                query = quote(content)
+                query = content.lower()
 
-            # Get the image URL
-            json = await utils.get_json_with_get('https://api.unsplash.com/photos/random?query=' + query,
-                                                 headers=headers)
-            author_url = json[0]['user']['links']['html'] + "?utm_source=SuitsBot&utm_medium=referral"
-            pic_embed = Embed().set_image(url=json[0]['urls']['full'])
+            # Get the image URL, from the query's prefetched photos if it's a popular query
+            photo = self.picture_cache.next(query)
+            if photo is None:
+                photo = (await get_unsplash_photos(query, 1))[0]
+            [image_url, author_url] = photo.split(" ", 1)
+            pic_embed = Embed().set_image(url=image_url)
             pic_embed.description = "Photo credit: " + author_url
             pic_embed.colour = EMBED_COLORS['picture']
             pic_embed.set_footer(icon_url=unsplash_icon,
@@ -137,17 +145,20 @@ class Images:
     @commands.command(pass_context=True, help=LONG_HELP['woof'], brief=BRIEF_HELP['woof'], aliases=ALIASES['woof'])
     async def woof(self, ctx):
         try:
-            # Get the image URL
-            json = await utils.get_json_with_get("https://dog.ceo/api/breeds/image/random")
+            # Get the image URL, fetching one if the cache is empty
+            woof_url = self.woof_cache.next()
+            if woof_url is None:
+                json = await utils.get_json_with_get("https://dog.ceo/api/breeds/image/random")
 
-            # If there is an error
-            if 'status' not in json[0].keys() or json[0]['status'] != "success":
-                await self.bot.say("I have encountered an error. Please contact the bot creator")
-                await utils.flag(self.bot, "Error with random dog api", description=json, ctx=ctx)
-                return
+                # If there is an error
+                if 'status' not in json[0].keys() or json[0]['status'] != "success":
+                    await self.bot.say("I have encountered an error. Please contact the bot creator")
+                    await utils.flag(self.bot, "Error with random dog api", description=json, ctx=ctx)
+                    return
+                woof_url = json[0]['message']
 
             # Embed the image and send it
-            woof_embed = Embed().set_image(url=json[0]['message'])
+            woof_embed = Embed().set_image(url=woof_url)
             woof_embed.colour = EMBED_COLORS['woof']
             await self.bot.say(embed=woof_embed)
         except Exception as e:
@@ -170,6 +181,82 @@ class CatCache(StringCache):
         return [result["url"] for result in json[0]]
 
 
+class DogCache(StringCache):
+    """ An implementation of the StringCache for dog photos """
+    def __init__(self, bot):
+        StringCache.__init__(self, bot, cache_id="woof")
+
+    async def gather(self):
+        """ Fetches dog urls from dog.ceo """
+        json = await utils.get_json_with_get("https://dog.ceo/api/breeds/image/random/10")
+        if json[0] is None or json[0].get("status") != "success":
+            raise RuntimeError(f"Error with random dog api: {json}")
+        return json[0]["message"]
+
+
+class UnsplashCache(StringCache):
+    """
+    An implementation of the StringCache for the photos of an Unsplash search
+    Each value is the photo's url and its author's url, separated by a space
+    """
+    def __init__(self, bot, query):
+        StringCache.__init__(self, bot, cache_id="unsplash-" + query, gather_limit=2,
+                             max_fill_size=30, gather_budget=UNSPLASH_POOL_GATHER_BUDGET,
+                             key_ttl=UNSPLASH_POOL_KEY_TTL_SECONDS)
+        self.query = query
+
+    async def gather(self):
+        """ Fetches photos from Unsplash """
+        return await get_unsplash_photos(self.query, 10)
+
+
+class ApodCache(DailyCache):
+    """ An implementation of the DailyCache for NASA's Astronomy Picture of the Day """
+    def __init__(self):
+        DailyCache.__init__(self, tz=tz.gettz("America/New_York"))  # The APOD changes at midnight Eastern time
+
+    async def fetch(self):
+        """ Fetches the APOD from NASA's API """
+        api_url = f"https://api.nasa.gov/planetary/apod?api_key={tokens['APOD']}"
+        [json, status_code] = await utils.get_json_with_get(api_url)
+        if status_code != 200:
+            raise RuntimeError(f"Failed to retrieve APOD, status code: {status_code}")
+        return json
+
+    def is_current(self, value, day):
+        """ The APOD is posted a little after midnight, so the previous day's may still be up """
+        return value.get("date") == day.isoformat()
+
+
+# The day's APOD, shared by `!nasa` and the daily post
+apod_cache = ApodCache()
+
+
+async def get_unsplash_photos(query, count):
+    """
+    Fetches random photos from an Unsplash search
+
+    :param query: The search term
+    :param count: The number of photos to fetch (at most 30)
+    :return: A list of the photos, as their url and their author's url separated by a space
+    """
+    [json, status_code] = await utils.get_json_with_get("https://api.unsplash.com/photos/random",
+                                                        params={"query": query, "count": str(count)},
+                                                        headers=UNSPLASH_HEADERS)
+    if status_code != 200:
+        raise RuntimeError(f"Failed to retrieve Unsplash photos, status code: {status_code}")
+    return [photo['urls']['full'] + " " + photo['user']['links']['html'] + "?utm_source=SuitsBot&utm_medium=referral"
+            for photo in json]
+
+
+async def prefetch_apod(bot):
+    """ Fetches the day's APOD in the background, so the first `!nasa` doesn't wait on NASA """
+    try:
+        await apod_cache.get()
+    except Exception as e:
+        await utils.report(bot, str(e), source="APOD prefetch")
+
+
 async def get_apod_embed():
     """
     Get's the day's APOD and returns an entity which can be posted
@@ -182,10 +269,7 @@ async def get_apod_embed():
     """
     embed_icon = "https://upload.wikimedia.org/wikipedia/commons/thumb/e/e5/NASA_logo.svg/" + \
                  "1200px-NASA_logo.svg.png"
-    api_url = f"https://api.nasa.gov/planetary/apod?api_key={tokens['APOD']}"
-    [json, status_code] = await utils.get_json_with_get(api_url)
-    if status_code != 200:
-        raise RuntimeError(f"Failed to retrieve APOD, status code: {status_code}")
+    json = await apod_cache.get()
     if json['media_type'] == "video":
         link_url = json['url'].replace("embed/", "watch?v=")  # Convert embed link to regular url
         return f"**{json['title']}**\n{json['explanation']}\n\n{link_url}"
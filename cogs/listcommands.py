@@ -1,9 +1,12 @@
+import asyncio
+from collections import OrderedDict
 from discord import Embed
 from discord.ext import commands
 from constants import *
 import utils
 import parse
 from local_config import AUTHORIZED_IDS
+from singleflight import SingleFlight
 
 
 class ListCommands:
@@ -21,23 +24,12 @@ class ListCommands:
     def __init__(self, bot):
         self.bot = bot
         self.failed_to_load = None
-        try:
-            list_table = self.loadlists()
-            self.list_engine = ListEngine(bot, list_table)
-            bot.list_engine = self.list_engine
-        except Exception as e:
-            self.bot.loading_failure["lists"] = e
+        self.list_engine = ListEngine(bot, max_users=LIST_MAX_RESIDENT_USERS)
+        bot.list_engine = self.list_engine
 
     @commands.command(pass_context=True, help=LONG_HELP['bestgirl'], brief=BRIEF_HELP['bestgirl'],
                       aliases=ALIASES['bestgirl'])
     async def bestgirl(self, ctx):
-        if "lists" in self.bot.loading_failure.keys():
-            await self.bot.send_message(ctx.message.channel,
-                                        "An error occurred while loading the lists during start up. " +
-                                        "Use of this command now could cause data loss. Please contact " +
-                                        "the bot owner")
-            return
-
         title = "!bestgirl - User Guide"
         description = "A dedicated command for modifying a user's `BestGirl` list. As with the more general `!list` "\
                       "command, it allows for the storage of a user created table. In this case, the table is "\
@@ -75,13 +67,6 @@ class ListCommands:
     # User creation of arbitrary lists and editing them
     @commands.command(pass_context=True, help=LONG_HELP['ls'], brief=BRIEF_HELP['ls'], aliases=ALIASES['ls'])
     async def ls(self, ctx):
-        if "lists" in self.bot.loading_failure.keys():
-            await self.bot.send_message(ctx.message.channel,
-                                        "An error occurred while loading the lists during start up. " +
-                                        "Use of this command now could cause data loss. Please contact " +
-                                        "the bot owner")
-            return
-
         title = "!list - User Guide"
         description = (
                     "List creation and management. Allows users to create arbitrary lists that the bot will store. " +
@@ -116,54 +101,6 @@ class ListCommands:
         except Exception as e:
             await utils.report(self.bot, str(e), source="!ls command", ctx=ctx)
 
-    def loadlists(self):
-        """ Load lists from database """
-
-        list_user_table = {}
-
-        # Load list metadata
-        select_query = "SELECT * FROM ListDetails"
-        cursor = self.bot.dbconn.execute(select_query)
-        for (user_id, list_id, title, thumbnail_url) in cursor:
-            list_id = list_id.decode("utf-8")
-            if title is not None:
-                title = title.decode("utf-8")
-            else:
-                title = None
-            if thumbnail_url is not None:
-                thumbnail_url = thumbnail_url.decode("utf-8")
-            else:
-                thumbnail_url = None
-            if user_id not in list_user_table.keys():
-                list_user_table[user_id] = {}
-            list_user_table[user_id][list_id] = UserList(self.bot,
-                                                         list_id=list_id,
-                                                         username=self.bot.users[user_id],
-                                                         thumbnail_url=thumbnail_url,
-                                                         title=title)
-            if list_id == "BestGirl":
-                list_user_table[user_id][list_id].color = EMBED_COLORS['bestgirl']
-
-        # Load list elements
-        select_query = "SELECT * FROM Lists"
-        cursor = self.bot.dbconn.execute(select_query)
-        for (user_id, list_id, list_index, element) in cursor:
-            list_id = list_id.decode("utf-8")
-            element = element.decode("utf-8")
-            if user_id not in list_user_table.keys():
-                raise AttributeError("User `" + user_id + "` not found in list_user_table.keys()")
-            if list_id not in list_user_table[user_id].keys():
-                raise AttributeError("Found element `` {} `` with ID `` {} `` for user `` {} `` with no "
-                                     "corresponding list".format(element, list_id, user_id))
-            userlist = list_user_table[user_id][list_id]
-            userlist.buffer(element, list_index)
-        for userLists in list_user_table.values():
-            for userlist in userLists.values():
-                userlist.commit()
-
-        return list_user_table
-
-
 class UserList:
     """
     Data type for storing the elements and attributes of a user's list
@@ -202,7 +139,12 @@ class UserList:
         self.updating = None
         self.updatingMessages = []
         self.color = color
-        self._bufferlist = []
+        self.version = 0  # Incremented whenever the contents change, for caching the rendered pages
+        self._rendered_version = None  # The (version, header) the cached pages were rendered for
+        self._pages = []  # The cached description of each page
+        self._embeds = []  # The cached embed of each page
+        self._message_hashes = []  # The hash of the page each of the updatingMessages shows
+        self._update_task = None  # The pending debounced update of the updatingMessages
 
     # -------------- INSTANCE METHODS
 
@@ -228,46 +170,36 @@ class UserList:
         if rank < 1:
             raise ValueError('Rank cannot be less than 0')
         self.contents.insert(rank - 1, entry)
-
-    def buffer(self, element, index):
-        """ Buffer elements
-        During start up, stores the elements as it gets them in their appropriate index
-        using `None` as spacers until all elements are assembled
-
-        Parameters
-        ------------ 
-        element: str
-            The text element to add to the list
-        index: int
-            The index in the list where the entry should be added
-
-        Raises
-        ------------ 
-        ValueError - If an entry is buffered to an already filled position
-        """
-        if len(self._bufferlist) <= index:
-            self._bufferlist.extend([None] * (index - len(self._bufferlist) + 1))
-        if self._bufferlist[index] is not None:
-            raise ValueError("List: " + self.id + "\nThere was already an element at index " + str(index) + "\n" +
-                             str(self._bufferlist))
-        del self._bufferlist[index]
-        self._bufferlist.insert(index, element)
+        self.version += 1
 
     def clear(self):
         """ Empties the contents of the list """
         self.contents = []
+        self.version += 1
 
-    def commit(self):
-        """ Commits the buffer to contents
+    def load(self, rows):
+        """ Sets the contents from the list's rows in the database, in a single pass
+
+        Parameters
+        ------------
+        rows: list[(int, str)]
+            The (index, element) pairs of the list. Rows read with `ORDER BY ListIndex` are
+            already sorted, which makes sorting them here linear
 
         Raises
-        ------------ 
-        ValueError - if any elements are missing
+        ------------
+        ValueError - If an index is repeated or missing
         """
-        for (index, element) in enumerate(self._bufferlist):
-            if element is None:
-                raise ValueError("None value in buffer found at index " + str(index) + " for list id " + self.id)
-        self.contents = self._bufferlist
+        rows.sort(key=lambda row: row[0])
+        contents = []
+        for (index, element) in rows:
+            if index != len(contents):
+                if index < len(contents):
+                    raise ValueError("List: " + self.id + "\nThere was already an element at index " + str(index))
+                raise ValueError("Missing element at index " + str(len(contents)) + " for list id " + self.id)
+            contents.append(element)
+        self.contents = contents
+        self.version += 1
 
     def isempty(self):
         """ Checks is the list is empty
@@ -278,59 +210,89 @@ class UserList:
         """
         return len(self.contents) == 0
 
-    # Returns the list of embeds which prints out the entire list
     def get_embeds(self):
+        """ Returns the list of embeds which prints out the entire list
 
-        # Generates a new blank embed
-        def new_embed(cont=False):
-            """
-             Generates a new list embed
-
-            Parameters
-            ------------
-            cont : bool
-                Whether or not this is a continuation of a previous embed. Defaults to false
-
-            Returns
-            ------------
-            A pre-formatted embed
-            """
-            embed = Embed()
-            if cont:
-                if self.title == "":
-                    embed.title = utils.trimtolength(self.id, 248) + " (cont.)"
-                else:
-                    embed.title = utils.trimtolength(self.title, 248) + " (cont.)"
+        The pages are cached until the list is edited. When it is, only the
+        pages whose text or header changed are rebuilt
+
+        Returns
+        ------------
+        list[Embed] - One embed per page of the list
+        """
+        header = (self.id, self.title, self.thumbnail_url, self.color)
+        if self._rendered_version == (self.version, header):
+            return list(self._embeds)
+
+        pages = self.paginate()
+        embeds = []
+        for (page_number, description) in enumerate(pages):
+            if (page_number < len(self._pages) and self._pages[page_number] == description
+                    and self._rendered_version is not None and self._rendered_version[1] == header):
+                embeds.append(self._embeds[page_number])
             else:
-                if self.title == "":
-                    embed.title = self.id
-                else:
-                    embed.title = self.title
-                embed.set_thumbnail(url=self.thumbnail_url)
-            embed.description = ""
-            embed.colour = self.color
-            embed.set_footer(text="[0/2048]")
-            return embed
+                embeds.append(self._new_embed(description, cont=page_number > 0))
+        (self._pages, self._embeds) = (pages, embeds)
+        self._rendered_version = (self.version, header)
+        return list(embeds)
 
-        curr_embed = new_embed()
-        embed_list = [curr_embed]
+    def paginate(self):
+        """ Splits the printed list into page descriptions of at most 2048 characters, in one pass
 
+        Returns
+        ------------
+        list[str] - The description of each page
+        """
         if len(self.contents) == 0:
-            curr_embed.description = "(This list is empty)"
-            return embed_list
-
-        lines = []
-        for i in range(0, len(self)):
-            lines.append(self.print_line(i + 1))
-
-        while len(lines) > 0:
-            # If the current embed is full, create a new one
-            if len(curr_embed.description) + len(lines[0]) > 2048:
-                curr_embed = new_embed(cont=True)
-                embed_list.append(curr_embed)
-            curr_embed.description += lines.pop(0)
-            curr_embed.set_footer(text="[" + str(len(curr_embed.description)) + "/2048]")
-        return embed_list
+            return ["(This list is empty)"]
+
+        pages = []
+        page_lines = []
+        page_length = 0
+        for rank in range(1, len(self.contents) + 1):
+            line = self.print_line(rank)
+            # If the current page is full, start a new one
+            if page_lines and page_length + len(line) > 2048:
+                pages.append("".join(page_lines))
+                page_lines = []
+                page_length = 0
+            page_lines.append(line)
+            page_length += len(line)
+        pages.append("".join(page_lines))
+        return pages
+
+    def _new_embed(self, description, cont=False):
+        """
+        Generates a list embed
+
+        Parameters
+        ------------
+        description : str
+            The text of the page
+        cont : bool
+            Whether or not this is a continuation of a previous embed. Defaults to false
+
+        Returns
+        ------------
+        A formatted embed
+        """
+        embed = Embed()
+        if cont:
+            if self.title == "":
+                embed.title = utils.trimtolength(self.id, 248) + " (cont.)"
+            else:
+                embed.title = utils.trimtolength(self.title, 248) + " (cont.)"
+        else:
+            if self.title == "":
+                embed.title = self.id
+            else:
+                embed.title = self.title
+            embed.set_thumbnail(url=self.thumbnail_url)
+        embed.description = description
+        embed.colour = self.color
+        length = 0 if len(self.contents) == 0 else len(description)
+        embed.set_footer(text="[" + str(length) + "/2048]")
+        return embed
 
     def __len__(self):
         return len(self.contents)
@@ -343,6 +305,7 @@ class UserList:
         element = self.contents[rank_current - 1]
         del self.contents[rank_current - 1]
         self.contents.insert(rank_target - 1, element)
+        self.version += 1
         return element
 
     def print_line(self, rank):
@@ -355,6 +318,7 @@ class UserList:
             raise ValueError('Index cannot be less than 0')
         value = self.contents[rank - 1]
         del self.contents[rank - 1]
+        self.version += 1
         return value
 
     def replace(self, element, rank):
@@ -364,6 +328,7 @@ class UserList:
             raise ValueError('Index cannot be less than 1')
         old_value = self.contents[rank - 1]
         self.contents[rank - 1] = element
+        self.version += 1
         return old_value
 
     async def set_thumbnail(self, url):
@@ -384,43 +349,109 @@ class UserList:
         element = self.contents[rank_a - 1]
         self.contents[rank_a - 1] = self.contents[rank_b - 1]
         self.contents[rank_b - 1] = element
+        self.version += 1
         return [self.contents[rank_a - 1], element]
 
-    async def update_messages(self):
-        """ Updates all of the list embed messages. 
-        If one of the embeds is no longer needed, the message is deleted
+    def page_hashes(self):
+        """ Returns a hash of each page's rendered output, for telling which pages an edit changed """
+        self.get_embeds()
+        header = (self.id, self.title, self.thumbnail_url, self.color)
+        return [hash((header, page_number > 0, description)) for (page_number, description) in enumerate(self._pages)]
+
+    async def send_updating(self, channel):
+        """ Sends the list to a channel as new messages, which are kept up to date as the list is edited
+
+        Parameters
+        -------------
+        channel : discord.Channel
+            The channel to send the list to
+        """
+        self.updatingMessages = []
+        self._message_hashes = self.page_hashes()
+        for embed in self.get_embeds():
+            self.updatingMessages.append(await self._bot.send_message(channel, embed=embed))
+
+    async def refresh(self, channel):
+        """ Shows the edited list. Sends it to the channel if it has no updating messages,
+        otherwise schedules an update of them
 
-        Returns 
+        Parameters
         -------------
-        Returns a boolean flag for whether the list overflowed the available 
-        embeds and could not be fully displayed
+        channel : discord.Channel
+            The channel to send the list to, if it isn't already being shown
+        """
+        if len(self.updatingMessages) == 0:
+            await self.send_updating(channel)
+        else:
+            self.schedule_update()
+
+    def schedule_update(self):
+        """ Updates the list embed messages after a short delay.
+        Edits made before the update runs are shown by the same update
+        """
+        if self._update_task is None and len(self.updatingMessages) > 0:
+            self._update_task = self._bot.loop.create_task(self._debounced_update())
+
+    async def _debounced_update(self):
+        """ Waits for any further edits, then updates the list embed messages """
+        await asyncio.sleep(LIST_UPDATE_DELAY_SECONDS)
+        self._update_task = None
+        await self.update_messages()
+
+    async def update_messages(self):
+        """ Updates the list embed messages, only editing the pages whose output changed.
+        If one of the embeds is no longer needed, the message is deleted.
+        If the list has outgrown its messages, it is sent again as new messages
         """
         try:
+            if len(self.updatingMessages) == 0:
+                return
             new_embeds = self.get_embeds()
-            new_message_list = []
+            new_hashes = self.page_hashes()
+            if len(new_embeds) > len(self.updatingMessages):
+                await self.send_updating(self.updatingMessages[0].channel)
+                return
             for i in range(0, len(new_embeds)):
-                if i < len(self.updatingMessages):
-                    if self.updatingMessages[i] is None:
-                        await utils.report(self._bot, "FOUND NONE MESSAGE")
-                        return True
-                    new_message_list.append(await self._bot.edit_message(self.updatingMessages[i], embed=new_embeds[i]))
-                else:
-                    self.updatingMessages = new_message_list
-                    return True
+                if self._message_hashes[i] != new_hashes[i]:
+                    self.updatingMessages[i] = await self._bot.edit_message(self.updatingMessages[i],
+                                                                            embed=new_embeds[i])
+                    self._message_hashes[i] = new_hashes[i]
             for message in self.updatingMessages[len(new_embeds):]:
                 await self._bot.delete_message(message)
-            self.updatingMessages = new_message_list
-            return False
+            del self.updatingMessages[len(new_embeds):]
+            del self._message_hashes[len(new_embeds):]
         except Exception as e:
             await utils.report(self._bot, str(e), source="update_messages")
 
 
+class ListsUnavailableError(Exception):
+    """ Raised when a user's lists can't be loaded because the database hasn't caught up with their edits """
+
+
 class ListEngine:
-    def __init__(self, bot, user_table):
+    """
+    Performs the `!list` functions and keeps the lists in sync with the database
+
+    A user's lists are loaded from the database the first time they are used. At most
+    `max_users` users' lists are kept in memory, and the least recently used user's lists
+    are dropped when another user's are loaded. A user's lists are never dropped while one
+    of their commands is running
+
+    Parameters
+    ------------
+    bot : discord.bot object
+        The bot object
+    max_users : Optional - int
+        The number of users whose lists are kept in memory (Default: 200)
+    """
+    def __init__(self, bot, max_users=200):
         self._bot = bot
-        self._dbconn = bot.dbconn
-        self.user_table = user_table
+        self._write_queue = bot.write_queue
+        self.max_users = max_users
+        self.user_table = OrderedDict()  # Maps a resident user's id to their {list_id: UserList}, least recent first
         self.spaces = {}
+        self._loading = SingleFlight()
+        self._in_use = {}  # Maps a user id to the number of their commands running, which keep them resident
 
         title = "!list - User Guide"
         description = "List creation and management. Allows users to create arbitrary lists that the self._bot will " \
@@ -455,19 +486,105 @@ class ListEngine:
                                         color=embedcolor)
         self._defaultembed = helpembed
 
-    def add_user(self, user_id):
+    async def load_user(self, user_id):
         """
-        Adds a user to the list engine. Adds the user to the user_table and
-        creates an entry for their bestGirl list in the ListDetails table
+        Returns a user's lists, loading them from the database if they aren't in memory
+
         Parameters
         -------------
         user_id : string
-            The Discord user id of the user being added
+            The Discord user id of the user
+
+        Returns
+        -------------
+        dict{str:UserList} - The user's lists, by list id
         """
-        self.user_table[user_id] = {}
-        self.create_list(user_id, "BestGirl")
+        user_lists = self.user_table.get(user_id)
+        if user_lists is not None:
+            self.user_table.move_to_end(user_id)
+            return user_lists
+        return await self._loading.do(user_id, self._load_user, user_id)
+
+    async def _load_user(self, user_id):
+        """ Loads a user's lists into memory, creating their BestGirl list if they're missing one """
+        # The database must have every queued edit to the user's lists before they are read,
+        # or later edits by index would be applied to a stale copy
+        await self._write_queue.flush()
+        if len(self._write_queue):
+            raise ListsUnavailableError("Your lists can't be loaded right now, because the database is behind. "
+                                        "Try again in a minute")
+        user_lists = await self._fetch_lists(user_id)
+        self._evict(self.max_users - 1)
+        self.user_table[user_id] = user_lists
+
+        if "BestGirl" not in user_lists and user_id in self._bot.users:
+            self.create_list(user_id, "BestGirl")
+            if user_lists.keys() != {"BestGirl"}:  # New users have no lists, so only existing users are flagged
+                await utils.flag(self._bot,
+                                 "Added missing BestGirl list to user",
+                                 description=str(user_id) + ":" + self._bot.users[user_id])
+        return user_lists
+
+    def _evict(self, max_users):
+        """ Drops the least recently used users' lists until at most `max_users` are resident, skipping users in use """
+        for user_id in list(self.user_table.keys()):
+            if len(self.user_table) <= max_users:
+                return
+            if user_id not in self._in_use:
+                del self.user_table[user_id]
+                self.spaces.pop(user_id, None)
+
+    async def _fetch_lists(self, user_id):
+        """ Reads a user's lists from the database and returns them as a table of {list_id: UserList} """
+        user_lists = {}
+        username = self._bot.users.get(user_id, "")
+
+        # Load list metadata
+        select_query = "SELECT * FROM ListDetails WHERE User=%s"
+        for (_, list_id, title, thumbnail_url) in await self._bot.dbconn.fetch(select_query, (user_id,)):
+            list_id = list_id.decode("utf-8")
+            if title is not None:
+                title = title.decode("utf-8")
+            if thumbnail_url is not None:
+                thumbnail_url = thumbnail_url.decode("utf-8")
+            user_lists[list_id] = UserList(self._bot,
+                                           list_id=list_id,
+                                           username=username,
+                                           thumbnail_url=thumbnail_url,
+                                           title=title)
+            if list_id == "BestGirl":
+                user_lists[list_id].color = EMBED_COLORS['bestgirl']
+
+        # Load list elements
+        list_rows = {list_id: [] for list_id in user_lists.keys()}
+        select_query = "SELECT * FROM Lists WHERE User=%s ORDER BY ListIndex"
+        for (_, list_id, list_index, element) in await self._bot.dbconn.fetch(select_query, (user_id,)):
+            list_id = list_id.decode("utf-8")
+            element = element.decode("utf-8")
+            if list_id not in list_rows.keys():
+                raise AttributeError("Found element `` {} `` with ID `` {} `` for user `` {} `` with no "
+                                     "corresponding list".format(element, list_id, user_id))
+            list_rows[list_id].append((list_index, element))
+        for (list_id, rows) in list_rows.items():
+            user_lists[list_id].load(rows)
+
+        return user_lists
 
     async def parse(self, ctx, helpembed=None, command="list", list_id=None):
+        """ Performs list manage functions, keeping the author's lists in memory until it has finished.
+        Takes the same parameters as `_parse()` """
+        author_id = ctx.message.author.id
+        self._in_use[author_id] = self._in_use.get(author_id, 0) + 1
+        try:
+            await self._parse(ctx, helpembed=helpembed, command=command, list_id=list_id)
+        except ListsUnavailableError as e:
+            await self._bot.send_message(ctx.message.channel, str(e))
+        finally:
+            self._in_use[author_id] -= 1
+            if not self._in_use[author_id]:
+                del self._in_use[author_id]
+
+    async def _parse(self, ctx, helpembed=None, command="list", list_id=None):
         """ Performs list manage functions
 
         Parameters
@@ -499,10 +616,8 @@ class ListEngine:
         # separates out the function call and its parameters
         [func, parameter] = parse.func_param(parsed_ctx)
 
-        # Premptively creates a list table if author does not have one
-        if author_id not in self.user_table.keys():
-            self.user_table[author_id] = {}
-        author_lists = self.user_table[author_id]
+        # Loads the author's lists, creating their BestGirl list if they don't have one
+        author_lists = await self.load_user(author_id)
 
         # Creates a 'None' entry in the self.spaces if author is not in it
         if author_id not in self.spaces.keys():
@@ -512,7 +627,7 @@ class ListEngine:
         if list_id is None:
             curr_list = self.spaces[author_id]
         else:
-            curr_list = self.user_table[author_id][list_id]
+            curr_list = author_lists[list_id]
         # LIST -------------------------------- FUNCTIONS
 
         # --------------------- DISPLAY FUNCTIONS
@@ -525,10 +640,7 @@ class ListEngine:
                                                  "You are not currently in any list. Type `!list use <id>` to "
                                                  "begin editing a list or `!list help` for more information")
                     return
-                embeds = curr_list.get_embeds()
-                curr_list.updatingMessages = []
-                for embed in embeds:
-                    curr_list.updatingMessages.append(await self._bot.send_message(ctx.message.channel, embed=embed))
+                await curr_list.send_updating(ctx.message.channel)
             except Exception as e:
                 await  utils.report(self._bot, str(e), source="List updating command, via " + command, ctx=ctx)
             return
@@ -569,11 +681,7 @@ class ListEngine:
                 [element, rank] = parse.stringandoptnum(parameter)  # Get index and element
                 curr_list.add(element, rank)
                 self.update_list_add(author_id, curr_list.id, element, rank)
-                if await curr_list.update_messages():
-                    embeds = curr_list.get_embeds()
-                    curr_list.updatingMessages = []
-                    for embed in embeds:
-                        curr_list.updatingMessages.append(await self._bot.send_message(ctx.message.channel, embed=embed))
+                await curr_list.refresh(ctx.message.channel)
                 if rank is None:
                     rank = len(curr_list)
                 await self._bot.send_message(ctx.message.channel,
@@ -610,7 +718,7 @@ class ListEngine:
                         return
                     author_lists[list_id].clear()  # clear the list
                 if curr_list is not None:
-                    await curr_list.update_messages()
+                    curr_list.schedule_update()
                 self.clear_list(author_id, curr_list.id)
                 await self._bot.send_message(ctx.message.channel,
                                              "Your list with ID `` " + list_id + " `` has been cleared")
@@ -720,7 +828,7 @@ class ListEngine:
                 numbers = parse.twonumbers(parameter)
                 element = curr_list.move(numbers[0], numbers[1])
                 self.update_list_move(author_id, curr_list.id, from_rank=numbers[0], to_rank=numbers[1])
-                await curr_list.update_messages()
+                curr_list.schedule_update()
                 await self._bot.send_message(ctx.message.channel,
                                              "Alright, I moved `` " + element + " `` to index " + str(numbers[1]))
             except ValueError as e:
@@ -742,17 +850,14 @@ class ListEngine:
                     addition = ""
                     for (i, element) in enumerate(elements):
                         addition += "**" + str(len(curr_list) + i + 1) + ".** " + element + "\n"
+                    added = []
                     for element in elements:  # Split the list at semicolons
                         element = element.strip()
                         if len(element) > 0:  # Add the item only if the element has text
                             curr_list.add(element)  # Add the element
-                            self.update_list_add(author_id, curr_list.id, element)
-                    if await curr_list.update_messages():
-                        embeds = curr_list.get_embeds()
-                        curr_list.updatingMessages = []
-                        for embed in embeds:
-                            curr_list.updatingMessages.append(await self._bot.send_message(ctx.message.channel,
-                                                                                          embed=embed))
+                            added.append(element)
+                    self.update_list_multiadd(author_id, curr_list.id, added)
+                    await curr_list.refresh(ctx.message.channel)
                     if len(elements) == 1:
                         await self._bot.send_message(ctx.message.channel,
                                                      "I have added " + str(len(elements)) + " element to your list")
@@ -814,7 +919,7 @@ class ListEngine:
                     else:
                         self.clear_list(author_id, curr_list.id)
 
-                await curr_list.update_messages()
+                curr_list.schedule_update()
                 await self._bot.send_message(ctx.message.channel,
                                              "I have removed `` " + " ``, `` ".join(removed_elements) +
                                              " `` from your list")
@@ -839,11 +944,7 @@ class ListEngine:
                                                  "[square brackets]")
                     return
                 old_val = curr_list.replace(element, rank)
-                if await curr_list.update_messages():
-                    embeds = curr_list.get_embeds()
-                    curr_list.updatingMessages = []
-                    for embed in embeds:
-                        curr_list.updatingMessages.append(await self._bot.send_message(ctx.message.channel, embed=embed))
+                await curr_list.refresh(ctx.message.channel)
                 self.update_list_element(author_id, curr_list.id, rank, element)
                 await self._bot.send_message(ctx.message.channel,
                                              "The element `` {} `` has been renamed to `` {} ``"
@@ -865,7 +966,12 @@ class ListEngine:
                                                          "instructions on how to use this function")
                             return
                         target_id = ctx.message.mentions[0].id
-                        for embed in self.user_table[target_id]["BestGirl"].get_embeds():
+                        target_lists = await self.load_user(target_id)
+                        if "BestGirl" not in target_lists:
+                            await self._bot.send_message(ctx.message.channel,
+                                                         "That user doesn't have a BestGirl list yet")
+                            return
+                        for embed in target_lists["BestGirl"].get_embeds():
                             await self._bot.send_message(ctx.message.channel, embed=embed)
                     return
                 if len(author_lists.keys()) == 0:
@@ -911,7 +1017,7 @@ class ListEngine:
                 numbers = parse.twonumbers(parameter)
                 elements = curr_list.swap(numbers[0], numbers[1])
                 self.update_list_swap(author_id, curr_list.id, numbers[0], numbers[1])
-                await curr_list.update_messages()
+                curr_list.schedule_update()
                 await self._bot.send_message(ctx.message.channel,
                                              "Alright, I swapped `` {} `` with `` {} ``".format(elements[0],
                                                                                                 elements[1]))
@@ -936,7 +1042,7 @@ class ListEngine:
                 else:
                     await curr_list.set_thumbnail(ctx.message.attachments[0]['url'])
                 self.update_list_details(author_id, curr_list.id)
-                await curr_list.update_messages()
+                curr_list.schedule_update()
                 await self._bot.send_message(ctx.message.channel, "Congratulations, your thumbnail has been updated")
             except ValueError as e:
                 await self._bot.send_message(ctx.message.channel, str(e))
@@ -966,7 +1072,7 @@ class ListEngine:
 
                 self.update_list_details(author_id, curr_list.id)  # Save to database
                 if curr_list is not None:
-                    await curr_list.update_messages()
+                    curr_list.schedule_update()
                 if old_title == "":
                     await self._bot.send_message(ctx.message.channel,
                                                  "Alright. I have set your title to `` " + parameter + " ``")
@@ -1001,10 +1107,7 @@ class ListEngine:
                 self.spaces[author_id] = author_lists[list_id]  # Set the list to be active
                 curr_list = author_lists[list_id]
 
-                embeds = curr_list.get_embeds()
-                curr_list.updatingMessages = []
-                for embed in embeds:
-                    curr_list.updatingMessages.append(await self._bot.send_message(ctx.message.channel, embed=embed))
+                await curr_list.send_updating(ctx.message.channel)
 
                 await self._bot.send_message(ctx.message.channel,
                                              "Alright, you are now using the list '" + list_id + "'")
@@ -1041,15 +1144,13 @@ class ListEngine:
         list_id : str
             The id of the list being updated
         """
-        self._dbconn.ensure_sql_connection()
         update_query = "UPDATE ListDetails SET Title=%s, ThumbnailURL=%s WHERE USER=%s AND ID=%s"
         update_data = (self.user_table[user_id][list_id].title,
                        self.user_table[user_id][list_id].thumbnail_url, user_id, list_id)
-        self._dbconn.execute(update_query, update_data)
-        self._dbconn.commit()
+        self._write_queue.put(update_query, update_data)
 
-    def update_list_shift(self, user_id, list_id, shift=0, from_rank=1, to_rank=0):
-        """ Shifts the rank of a block of elements
+    def shift_statement(self, user_id, list_id, shift=0, from_rank=1, to_rank=0):
+        """ Builds the command which shifts the rank of a block of elements
 
         Parameters
         -------------
@@ -1064,11 +1165,15 @@ class ListEngine:
             The rank (inclusive) to begin the shift. If no value is provided, the range begins at the start
         to_rank : Optional - int
             The rank (inclusive) to end the shift. If no value is provided, the range ends at the start
+
+        Returns
+        -------------
+        A (command, data) pair to queue, or None if there is nothing to shift
         """
         # Reject invalid parameter
         list_length = len(self.user_table[user_id][list_id])
         if shift == 0:
-            return
+            return None
         if from_rank > list_length:
             raise ValueError("from_rank cannot be greater than list length.\nList length is: %s\nfrom_rank was: %s"
                              .format(list_length, from_rank))
@@ -1082,13 +1187,10 @@ class ListEngine:
             to_rank = list_length
 
         # Shift indices
-        self._dbconn.ensure_sql_connection()
         shift_command = 'UPDATE Lists SET ListIndex=ListIndex + %s ' \
                         'WHERE User=%s AND ID=%s AND ListIndex >= %s AND ListIndex <= %s;'
         shift_data = (shift, user_id, list_id, from_rank - 1, to_rank - 1)
-        self._dbconn.execute(shift_command, shift_data)
-        # Commit shift
-        self._dbconn.commit()
+        return shift_command, shift_data
 
     def update_list_add(self, user_id, list_id, element, rank=None):
         """ Adds an element to the list and updates other indices
@@ -1105,18 +1207,34 @@ class ListEngine:
             The 1-indexed rank where the element will be inserted.
             If no value or None is provided, defaults to the end of the list
         """
-        self._dbconn.ensure_sql_connection()
+        statements = []
         if rank is None:
             rank = len(self.user_table[user_id][list_id])
         else:
             # Shift down the existing elements below the insertion point
-            self.update_list_shift(user_id, list_id, shift=1, from_rank=rank)
+            statements.append(self.shift_statement(user_id, list_id, shift=1, from_rank=rank))
         # Add the new data
         add_command = "INSERT INTO Lists VALUES (%s, %s, %s, %s)"
         add_data = (user_id, list_id, rank - 1, element)
-        self._dbconn.execute(add_command, add_data)
-        # Commit change
-        self._dbconn.commit()
+        statements.append((add_command, add_data))
+        self._write_queue.put_group(statements)
+
+    def update_list_multiadd(self, user_id, list_id, elements):
+        """ Adds elements to the end of the list, in one statement
+
+        Parameters
+        -------------
+        user_id : str
+            The 18 digit user id of the user making the edit
+        list_id : str
+            The id of the list being edited
+        elements : list[str]
+            The elements which were appended to the list, in order
+        """
+        first_index = len(self.user_table[user_id][list_id]) - len(elements)
+        add_command = "INSERT INTO Lists VALUES (%s, %s, %s, %s)"
+        self._write_queue.put_many(add_command, [(user_id, list_id, first_index + i, element)
+                                                 for (i, element) in enumerate(elements)])
 
     def update_list_remove(self, user_id, list_id, rank):
         """ Removes an element from the list and updates remaining indices
@@ -1130,19 +1248,11 @@ class ListEngine:
         rank : int
             The 1-indexed rank of the element being removed
         """
-        self._dbconn.ensure_sql_connection()
-        # Remove the entry
+        # Remove the entry, and shift up every element below it
         remove_command = "DELETE FROM Lists WHERE User=%s AND ID=%s AND ListIndex=%s"
-        remove_data = (user_id, list_id, rank - 1)
-        self._dbconn.execute(remove_command, remove_data)
-        # Shift up the remaining elements below the removed item
-        self.update_list_shift(user_id,
-                               list_id,
-                               shift=-1,
-                               from_rank=rank + 1,
-                               to_rank=len(self.user_table[user_id][list_id]) + 1)
-        # Commit the change
-        self._dbconn.commit()
+        shift_command = "UPDATE Lists SET ListIndex = ListIndex - 1 WHERE User=%s AND ID=%s AND ListIndex > %s"
+        self._write_queue.put_group([(remove_command, (user_id, list_id, rank - 1)),
+                                     (shift_command, (user_id, list_id, rank - 1))])
 
     def update_list_move(self, user_id, list_id, from_rank, to_rank):
         """ Moves an element from one rank to another and shifts the elements in between
@@ -1158,23 +1268,15 @@ class ListEngine:
         to_rank : int
             The 1-indexed rank the element is being moved to
         """
-        self._dbconn.ensure_sql_connection()
-        # Get the element
-        element = self.user_table[user_id][list_id].contents[to_rank - 1]
-        # Remove the element
-        remove_command = "DELETE FROM Lists WHERE User=%s AND ID=%s AND ListIndex=%s"
-        remove_data = (user_id, list_id, from_rank - 1)
-        self._dbconn.execute(remove_command, remove_data)
-        # Shift the elements in between
-        if from_rank > to_rank:
-            self.update_list_shift(user_id, list_id, shift=1, from_rank=to_rank, to_rank=from_rank)
-        else:
-            self.update_list_shift(user_id, list_id, shift=-1, from_rank=from_rank, to_rank=to_rank)
-        # Add the element back in
-        add_command = "INSERT INTO Lists VALUES (%s, %s, %s, %s)"
-        add_data = (user_id, list_id, to_rank - 1, element)
-        self._dbconn.execute(add_command, add_data)
-        self._dbconn.commit()
+        if from_rank == to_rank:
+            return
+        # The moved element takes its new index, and the elements in between shift one place towards its old index
+        shift = "ListIndex - 1" if from_rank < to_rank else "ListIndex + 1"
+        move_command = ("UPDATE Lists SET ListIndex = CASE WHEN ListIndex=%s THEN %s ELSE " + shift + " END "
+                        "WHERE User=%s AND ID=%s AND ListIndex >= %s AND ListIndex <= %s")
+        move_data = (from_rank - 1, to_rank - 1, user_id, list_id,
+                     min(from_rank, to_rank) - 1, max(from_rank, to_rank) - 1)
+        self._write_queue.put(move_command, move_data)
 
     def update_list_element(self, user_id, list_id, rank, element):
         """ Updates the contents of a particular rank
@@ -1190,11 +1292,9 @@ class ListEngine:
         element : str
             The new name of the element
         """
-        self._dbconn.ensure_sql_connection()
         update_command = "UPDATE Lists SET Element=%s WHERE User=%s AND ID=%s AND ListIndex=%s"
         update_data = (element, user_id, list_id, rank - 1)
-        self._dbconn.execute(update_command, update_data)
-        self._dbconn.commit()
+        self._write_queue.put(update_command, update_data)
 
     def update_list_swap(self, user_id, list_id, rank1, rank2):
         """ Swaps the rank of two elements
@@ -1210,23 +1310,10 @@ class ListEngine:
         rank2 : int
             The 1-indexed rank of the other element being swapped
         """
-        self._dbconn.ensure_sql_connection()
-
-        # Temporarily shift element at rank1 to index [-1] to prevent overlap
-        update_command = "UPDATE Lists SET ListIndex=%s WHERE User=%s AND ID=%s AND ListIndex=%s"
-        update_data = (-1, user_id, list_id, rank1 - 1)
-        self._dbconn.execute(update_command, update_data)
-
-        # Move element at rank2 to rank1
-        update_command = "UPDATE Lists SET ListIndex=%s WHERE User=%s AND ID=%s AND ListIndex=%s"
-        update_data = (rank1 - 1, user_id, list_id, rank2 - 1)
-        self._dbconn.execute(update_command, update_data)
-
-        # Move element placed at index [-1] to rank2
-        update_command = "UPDATE Lists SET ListIndex=%s WHERE User=%s AND ID=%s AND ListIndex=%s"
-        update_data = (rank2 - 1, user_id, list_id, -1)
-        self._dbconn.execute(update_command, update_data)
-        self._dbconn.commit()
+        swap_command = ("UPDATE Lists SET ListIndex = CASE WHEN ListIndex=%s THEN %s ELSE %s END "
+                        "WHERE User=%s AND ID=%s AND ListIndex IN (%s, %s)")
+        swap_data = (rank1 - 1, rank2 - 1, rank1 - 1, user_id, list_id, rank1 - 1, rank2 - 1)
+        self._write_queue.put(swap_command, swap_data)
 
     def create_list(self, user_id, list_id):
         """ Creates a list for a user
@@ -1238,12 +1325,10 @@ class ListEngine:
         list_id : str
             The id of the list being created
         """
-        self._dbconn.ensure_sql_connection()
         create_command = "INSERT INTO ListDetails VALUES (%s, %s, %s, %s)"
         create_data = (user_id, list_id, None, None)
         self.user_table[user_id][list_id] = UserList(self._bot, list_id, username=self._bot.users[user_id])
-        self._dbconn.execute(create_command, create_data)
-        self._dbconn.commit()
+        self._write_queue.put(create_command, create_data)
 
     def clear_list(self, user_id, list_id):
         """ Clears a user's list
@@ -1255,11 +1340,9 @@ class ListEngine:
         list_id : str
             The id of the list being cleared
         """
-        self._dbconn.ensure_sql_connection()
         delete_command = "DELETE FROM Lists WHERE User=%s AND ID=%s"
         delete_data = (user_id, list_id)
-        self._dbconn.execute(delete_command, delete_data)
-        self._dbconn.commit()
+        self._write_queue.put(delete_command, delete_data)
 
     def drop_list(self, user_id, list_id):
         """ Deletes a user's list
@@ -1271,14 +1354,8 @@ class ListEngine:
         list_id : str
             The id of the list being dropped
         """
-        self._dbconn.ensure_sql_connection()
-        delete_command = "DELETE FROM Lists WHERE User=%s AND ID=%s"
-        delete_data = (user_id, list_id)
-        self._dbconn.execute(delete_command, delete_data)
-        delete_command = "DELETE FROM ListDetails WHERE User=%s AND ID=%s"
-        delete_data = (user_id, list_id)
-        self._dbconn.execute(delete_command, delete_data)
-        self._dbconn.commit()
+        self._write_queue.put_group([("DELETE FROM Lists WHERE User=%s AND ID=%s", (user_id, list_id)),
+                                     ("DELETE FROM ListDetails WHERE User=%s AND ID=%s", (user_id, list_id))])
 
 
 def setup(bot):
@@ -1,13 +1,22 @@
+import asyncio
 from datetime import datetime, timedelta
+import gzip
+import json
+import os
 from random import randint
 import re
 from discord.ext import commands
 from discord import Embed
 from constants import *
 import parse
+from singleflight import SingleFlight
 import utils
 
 
+# Bumped whenever the snapshot format changes, so old snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+
 class RSSCrawler:
     """
     Commands dealing with fetching rss feeds
@@ -40,6 +49,64 @@ class RSSCrawler:
                      color=0xFFFFFF),
         ]
 
+        # Warm the feeds up from the last snapshot, then keep them fresh
+        # in the background, so commands are answered from memory
+        self._snapshot_lock = asyncio.Lock()
+        self.bot.loop.create_task(self.load_snapshot())
+        self.bot.scheduler.add_minutely_task(self.refresh_feeds)
+
+    def __unload(self):
+        self.bot.scheduler.remove_task(self.refresh_feeds)
+
+    async def refresh_feeds(self, curr_time):
+        """
+        Starts a background refresh of the stale feed which is most overdue.
+        Run by the scheduler every minute, so refreshes are spread out one feed per minute
+        :param curr_time: A value passed to all scheduled tasks
+        """
+        stale_feeds = [feed for feed in self.feeds if feed.is_stale() and not feed.is_backing_off(curr_time)]
+        if stale_feeds:
+            feed = min(stale_feeds, key=lambda stale_feed: stale_feed.expiry())
+            self.bot.loop.create_task(self.refresh_in_background(feed))
+
+    async def refresh_in_background(self, feed):
+        """
+        Refreshes a feed, reporting instead of raising if it fails.
+        A feed which fails is not retried for RSS_REFRESH_RETRY_MINUTES
+        :param feed: The RSSFeed
+        """
+        try:
+            await self.refresh_feed(feed)
+        except Exception as e:
+            feed.retry_time = datetime.today() + timedelta(minutes=RSS_REFRESH_RETRY_MINUTES)
+            await utils.report(self.bot, str(e), source=f"Background refresh of '{feed.feed_id}'")
+
+    async def refresh_feed(self, feed):
+        """
+        Refreshes a feed and saves the new data to the snapshot
+        :param feed: The RSSFeed
+        """
+        await feed.refresh()
+        await self.save_snapshot()
+
+    async def load_snapshot(self):
+        """ Loads the feeds saved in the snapshot, so they don't need to be downloaded after a restart """
+        try:
+            snapshot = await self.bot.loop.run_in_executor(None, read_snapshot, RSS_SNAPSHOT_PATH)
+            for feed in self.feeds:
+                if feed.items is None and feed.feed_id in snapshot:
+                    feed.restore(snapshot[feed.feed_id])
+        except Exception as e:
+            # This can finish after on_ready has reported the loading failures, so it is reported directly
+            await utils.report(self.bot, f"FAILED TO LOAD RSS SNAPSHOT\n{type(e).__name__}: {e}",
+                               source="load_snapshot")
+
+    async def save_snapshot(self):
+        """ Saves every loaded feed to the snapshot """
+        snapshot = {feed.feed_id: feed.to_snapshot() for feed in self.feeds if feed.items is not None}
+        async with self._snapshot_lock:
+            await self.bot.loop.run_in_executor(None, write_snapshot, RSS_SNAPSHOT_PATH, snapshot)
+
     # Searches for an item in your favorite RSS Feeds
     @commands.command(pass_context=True, help=LONG_HELP['rssfeed'],
                       brief=BRIEF_HELP['rssfeed'], aliases=ALIASES["rssfeed"])
@@ -65,8 +132,12 @@ class RSSCrawler:
         try:
             message = parse.stripcommand(ctx.message.content)
 
-            # Update feed
-            feed.refresh_if_stale()
+            # Update feed. A feed which has never loaded must be fetched now, but a stale
+            # feed is served as it is while it refreshes in the background
+            if feed.items is None:
+                await self.refresh_feed(feed)
+            elif feed.is_stale():
+                self.bot.loop.create_task(self.refresh_in_background(feed))
 
             # Show most recent episode
             if message == "":
@@ -132,7 +203,7 @@ class RSSCrawler:
 
             # Force a refresh on the feed
             if subcommand == "refresh":
-                feed.refresh()
+                await self.refresh_feed(feed)
                 await self.bot.say(f"Alright, I have refreshed the feed `{feed.feed_id}`")
                 return
 
@@ -167,7 +238,8 @@ class RSSFeed:
     :param url: The url of the feed
     :param color: The color of the embed for episodes
     :param ttl: A timedelta object representing how long the cache
-        can last before it is considered "stale". Defaults to 1 minute
+        can last before it is considered "stale". Defaults to 24 hours.
+        Replaced by the channel's ttl if the feed provides one
     """
     def __init__(self, feed_id, url, color=EMBED_COLORS["default"], ttl=timedelta(hours=24)):
         self.feed_id = feed_id
@@ -179,15 +251,19 @@ class RSSFeed:
         # RSS Info. These values are not defined at init and
         # must be fetched by refreshing the feed
 
-        self.raw_rss = None  # The feedparser dictionary
-        self.feed = None  # The "feed" object from feedparser
-        self.channel = None  # The channel object
         self.fetch_time = None  # When the item was fetched
         self.title = feed_id  # The title of the feed (temporarily set to feed_id)
         self.subtitle = None  # The description of the feed
         self.image = None  # The covert art for the feed
         self.link = None  # The website associated with the feed
         self.items = None  # The list of items in the feed
+        self.index = {}  # Maps each lowercase word in an item title to the positions of the items using it
+
+        # Validators for conditional requests, so an unchanged feed isn't downloaded again
+        self.etag = None  # The ETag header of the last fetch
+        self.modified = None  # The Last-Modified header of the last fetch
+        self._refreshing = SingleFlight()  # Shares one refresh between everyone waiting on it
+        self.retry_time = None  # When a feed which failed to refresh can be tried again
 
     def __len__(self):
         """
@@ -199,7 +275,8 @@ class RSSFeed:
     def search(self, term, regex=False):
         """
         Finds the most recent item in the feed whose title contains the search term
-        This search is for whole words only (unless using regex search)
+        This search is for whole words only (unless using regex search). If the term
+        has several words, the title must contain all of them, in any order
 
         :param term: The term being searched for
         :param regex: Whether to regex escape the search term. For the true nerds
@@ -207,6 +284,12 @@ class RSSFeed:
         :return: If it finds an appropriate episode, it returns it.
             If it can't find any matching episode, it returns null
         """
+        words = tokenize(term)
+        if not regex and words:
+            position = search_index(self.index, words)
+            return None if position is None else self.items[position]
+
+        # Regex searches (and terms without any words) are checked against every title
         if regex:
             pattern = re.compile(term)
         else:
@@ -222,6 +305,8 @@ class RSSFeed:
 Title: {self.title}
 Item Count: {len(self.items)}
 Fetch time: {self.fetch_time}
+ETag: {self.etag}
+Last-Modified: {self.modified}
 """
         return string
 
@@ -230,38 +315,94 @@ Fetch time: {self.fetch_time}
         Checks if the information is stale (older than 24 hours)
         :return: Returns 'True' if the stored data was cached more than 24 hours ago
         """
-        if self.raw_rss is None:
+        if self.items is None:
             return True
-        return datetime.today() > self.fetch_time + self.ttl
+        return datetime.today() > self.expiry()
 
-    def refresh(self):
+    def expiry(self):
         """
-        Updates the cached data
-        :return:
+        :return: When the stored data becomes stale. Feeds which have never been fetched expired long ago
         """
-        self.raw_rss = utils.get_rss_feed(self.feed_url)
-        self.fetch_time = datetime.today()
-        self.channel = self.raw_rss["channel"]
-        self.items = self.raw_rss["items"]
+        if self.items is None:
+            return datetime.min
+        return self.fetch_time + self.ttl
 
-        self.feed = self.raw_rss["feed"]
-        self.subtitle = self.feed.subtitle
-        self.link = self.feed["link"]
-        if self.feed.image:
-            self.image = self.feed.image["href"]
+    def is_backing_off(self, now):
+        """
+        :param now: The current time
+        :return: Returns 'True' if the last refresh failed and the feed shouldn't be retried yet
+        """
+        return self.retry_time is not None and now < self.retry_time
 
-        self.title = self.channel["title"]
+    async def refresh(self):
+        """
+        Updates the cached data. If the feed hasn't changed since the
+        last fetch, the items already parsed are kept.
+        Concurrent calls share a single fetch
+        :return:
+        """
+        await self._refreshing.do(None, self._refresh)
+
+    async def _refresh(self):
+        """ Fetches the feed and swaps the new data in """
+        rss = await utils.get_rss_feed(self.feed_url, etag=self.etag, modified=self.modified, transform=trim_feed)
+        if rss["status"] == 304 and self.items is not None:
+            self.fetch_time = datetime.today()
+            self.retry_time = None
+            return
+        self._apply(rss, datetime.today())
+
+    def _apply(self, data, fetch_time):
+        """
+        Swaps in a trimmed feed
+        :param data: A dictionary created by trim_feed(), with the 'etag' and 'modified' validators added
+        :param fetch_time: When the data was fetched
+        """
+        # Everything is read before anything is assigned, and nothing is awaited
+        # while assigning, so commands never see a half updated feed
+        image = data["image"] if data["image"] else self.image
+        ttl = timedelta(minutes=int(data["ttl"])) if data["ttl"] else self.ttl  # Optional element, in minutes
+        index = build_index(data["items"])
+
+        self.fetch_time = fetch_time
+        self.etag = data["etag"]
+        self.modified = data["modified"]
+        self.items = data["items"]
+        self.index = index
+        self.subtitle = data["subtitle"]
+        self.link = data["link"]
+        self.image = image
+        self.title = data["title"]
+        self.ttl = ttl
+        self.retry_time = None
 
-        # Optional elements
-        if "ttl" in self.channel:
-            self.ttl = self.channel["ttl"]
+    def to_snapshot(self):
+        """
+        :return: The feed's data as a JSON serializable dictionary, to be loaded by restore()
+        """
+        return {"fetch_time": self.fetch_time.timestamp(),
+                "etag": self.etag,
+                "modified": self.modified,
+                "title": self.title,
+                "subtitle": self.subtitle,
+                "link": self.link,
+                "image": self.image,
+                "ttl": int(self.ttl.total_seconds() // 60),
+                "items": self.items}
+
+    def restore(self, snapshot):
+        """
+        Loads the feed's data from a snapshot. The feed is refreshed as normal once the data goes stale
+        :param snapshot: A dictionary created by to_snapshot()
+        """
+        self._apply(snapshot, datetime.fromtimestamp(snapshot["fetch_time"]))
 
-    def refresh_if_stale(self):
+    async def refresh_if_stale(self):
         """
         Helper method. Only refreshes information if cache is 'data' (i.e. data is older than max_age)
         """
         if self.is_stale():
-            self.refresh()
+            await self.refresh()
 
     def get_embed(self, item):
         """
@@ -273,7 +414,7 @@ Fetch time: {self.fetch_time}
         embed.colour = self.color
         embed.title = item["title"]
         embed.url = item["link"]
-        if "description" in item:
+        if "subtitle" in item or "summary" in item:
             description = item["subtitle"] if "subtitle" in item else item["summary"]
             embed.description = utils.trimtolength(description, 2048)
         embed.set_author(name=self.title, url=self.link)
@@ -284,9 +425,8 @@ Fetch time: {self.fetch_time}
         embed.add_field(name="Quality", value=f"{randint(20, 100) / 10}/10")
 
         # look through enclosures for an image
-        for enclosure in item.links:
-            if enclosure["type"].startswith("image"):
-                embed.set_image(url=enclosure["href"])
+        for enclosure in item["links"]:
+            embed.set_image(url=enclosure["href"])
 
         embed.set_footer(text=utils.trimtolength(f"{self.title} - {self.subtitle}", 256))
         return embed
@@ -316,14 +456,121 @@ class WebComic(RSSFeed):
         return embed
 
 
+def trim_feed(rss):
+    """
+    Reduces a parsed feed to the plain data used by RSSFeed. Run in the parsing process,
+    so only what is used is sent back to the bot (and saved in the snapshot)
+    :param rss: The feedparser object
+    :return: A dictionary of the feed's details and items
+    """
+    feed = rss["feed"]
+    image = feed.get("image")
+    return {"title": feed.get("title", ""),
+            "subtitle": feed.get("subtitle"),
+            "link": feed.get("link"),
+            "image": image.get("href") if image else None,
+            "ttl": feed.get("ttl"),
+            "items": [trim_item(item) for item in rss["items"]]}
+
+
+def trim_item(item):
+    """
+    Reduces a parsed feed item to the fields used for searching and embeds
+    :param item: The feedparser item
+    :return: A dictionary of the item's title, link, publish time, description and image enclosures
+    """
+    published = item.get("published_parsed")
+    trimmed = {"title": item.get("title", ""),
+               "link": item.get("link"),
+               "published_parsed": None if published is None else tuple(published),
+               "links": [{"href": link["href"]} for link in item.get("links", [])
+                         if link.get("type", "").startswith("image")]}
+    for key in ["subtitle", "summary"]:
+        if key in item:
+            trimmed[key] = item[key]
+    return trimmed
+
+
+def read_snapshot(path):
+    """
+    Reads the feed snapshot. Runs in the executor
+    :param path: The snapshot file
+    :return: A dictionary mapping feed ids to their snapshots. Empty if there is no usable snapshot
+    """
+    if not os.path.exists(path):
+        return {}
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        snapshot = json.load(file)
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        return {}
+    return snapshot["feeds"]
+
+
+def write_snapshot(path, feeds):
+    """
+    Writes the feed snapshot. The file is replaced in one step, so a crash never leaves half a snapshot.
+    Runs in the executor
+    :param path: The snapshot file
+    :param feeds: A dictionary mapping feed ids to their snapshots
+    """
+    temp_path = path + ".tmp"
+    with gzip.open(temp_path, "wt", encoding="utf-8") as file:
+        json.dump({"version": SNAPSHOT_VERSION, "feeds": feeds}, file, separators=(",", ":"))
+    os.replace(temp_path, path)
+
+
+def tokenize(text):
+    """
+    Splits text into the lowercase words used by the search index
+    :param text: The text to split
+    :return: A list of words
+    """
+    return re.findall(r"\w+", text.lower())
+
+
+def build_index(items):
+    """
+    Creates a word index for searching a feed's item titles
+    :param items: The items of a feed, newest first
+    :return: A dictionary mapping each word to the ascending positions of the items whose titles contain it
+    """
+    index = {}
+    for (position, item) in enumerate(items):
+        for word in set(tokenize(item["title"])):
+            index.setdefault(word, []).append(position)
+    return index
+
+
+def search_index(index, words):
+    """
+    Finds the newest item whose title contains every word
+    :param index: An index created by build_index()
+    :param words: The words to look for
+    :return: The position of the item, or None if no title contains every word
+    """
+    # Start from the rarest word, so the fewest positions need to be checked
+    postings = sorted((index.get(word, []) for word in set(words)), key=len)
+    if not postings[0]:
+        return None
+    if len(postings) == 1:
+        return postings[0][0]
+    others = [set(positions) for positions in postings[1:]]
+    for position in postings[0]:
+        if all(position in other for other in others):
+            return position
+    return None
+
+
 def format_time(time):
     """
-    Formats a datetime object for easy human viewing
+    Formats a publish time for easy human viewing
     Formats to ISO 8601
-    :param time: The datetime object
+    :param time: The time tuple (year, month, day, ...)
     :return: The time in 'YYYY-MM-DD' format
     """
-    return f"{time.tm_year}-{time.tm_mon}-{time.tm_mday}"
+    if time is None:
+        return "Unknown"
+    return f"{time[0]}-{time[1]}-{time[2]}"
 
 
 def setup(bot):
@@ -1,3 +1,4 @@
+import asyncio
 from discord.ext import commands
 from constants import *
 import parse
@@ -29,10 +30,8 @@ class Tags:
     def __init__(self, bot):
         self.bot = bot
         self.tags = {"global": {}, "server": {}, "user": {}}
-        try:
-            self.loadtags()
-        except Exception as e:
-            self.bot.loading_failure["tags"] = e
+        self.loaded = asyncio.Event()  # Set once the tags have been loaded. Commands wait for it
+        self.bot.loop.create_task(self.loadtags())
 
     @commands.command(pass_context=True, help=LONG_HELP['tag'], brief=BRIEF_HELP['tag'], aliases=ALIASES['tag'])
     async def tag(self, ctx):
@@ -47,6 +46,8 @@ class Tags:
         try:
             # -------------------------------- SET-UP
 
+            await self.loaded.wait()
+
             # Makes the apostrophe types consistent
             # (See function documentation for explanation)
             parsed_ctx = parse.apos(ctx.message.content)
@@ -235,23 +236,29 @@ class Tags:
     async def yes(self):
         await self.bot.say("https://www.youtube.com/watch?v=sq_Fm7qfRQk")
 
-    def loadtags(self):
-        """ Load tags from database """
-        self.tags = {"global": {}, "server": {}, "user": {}}
-        query = "SELECT * FROM Tags"
-        cursor = self.bot.dbconn.execute(query)
-        for (owner_id, key_string, value_string, domain) in cursor:
-            key_string = key_string.decode("utf-8")
-            value_string = value_string.decode("utf-8")
-            if domain == "global":
-                self.tags["global"][key_string] = value_string
-            else:
-                if owner_id not in self.tags[domain].keys():
-                    self.tags[domain][owner_id] = {}
-                self.tags[domain][owner_id][key_string] = value_string
+    async def loadtags(self):
+        """ Load tags from database. Commands wait until this has finished, so no edits are made mid-load """
+        try:
+            tags = {"global": {}, "server": {}, "user": {}}
+            query = "SELECT * FROM Tags"
+            for (owner_id, key_string, value_string, domain) in await self.bot.dbconn.fetch(query):
+                key_string = key_string.decode("utf-8")
+                value_string = value_string.decode("utf-8")
+                if domain == "global":
+                    tags["global"][key_string] = value_string
+                else:
+                    if owner_id not in tags[domain].keys():
+                        tags[domain][owner_id] = {}
+                    tags[domain][owner_id][key_string] = value_string
+            self.tags = tags
+        except Exception as e:
+            # This can finish after on_ready has reported the loading failures, so it is reported directly
+            await utils.report(self.bot, f"FAILED TO LOAD TAGS\n{type(e).__name__}: {e}", source="loadtags")
+        finally:
+            self.loaded.set()
 
     def update_tag_add(self, tag_key, tag_value, owner_id, domain):
-        """ Adds a tag to the database
+        """ Queues adding a tag to the database
 
         Parameters
         -------------
@@ -270,14 +277,12 @@ class Tags:
             "server" - Server tags. The default domain for the bot and accessible to all users on a server
             "user" - User tags. Follow users between servers and can be accessed with the `-u` argument
         """
-        self.bot.dbconn.ensure_sql_connection()
         add_command = "INSERT INTO Tags VALUES (%s, %s, %s, %s)"
         add_data = (owner_id, tag_key, tag_value, domain)
-        self.bot.dbconn.execute(add_command, add_data)
-        self.bot.dbconn.commit()
+        self.bot.write_queue.put(add_command, add_data)
 
     def update_tag_remove(self, tag_key, owner_id, domain):
-        """ Removes a tag from the database
+        """ Queues removing a tag from the database
 
         Parameters
         -------------
@@ -294,14 +299,12 @@ class Tags:
             "server" - Server tags. The default domain for the bot and accessible to all users on a server
             "user" - User tags. Follow users between servers and can be accessed with the `-u` argument
         """
-        self.bot.dbconn.ensure_sql_connection()
         remove_command = "DELETE FROM Tags WHERE Owner=%s AND KeyString=%s AND Domain=%s"
         remove_data = (owner_id, tag_key, domain)
-        self.bot.dbconn.execute(remove_command, remove_data)
-        self.bot.dbconn.commit()
+        self.bot.write_queue.put(remove_command, remove_data)
 
     def update_tag_edit(self, tag_key, tag_value, owner_id, domain):
-        """ Edits a tag in the database
+        """ Queues editing a tag in the database
 
         Parameters
         -------------
@@ -320,11 +323,9 @@ class Tags:
             "server" - Server tags. The default domain for the bot and accessible to all users on a server
             "user" - User tags. Follow users between servers and can be accessed with the `-u` argument
         """
-        self.bot.dbconn.ensure_sql_connection()
         edit_command = "UPDATE Tags SET ValueString=%s WHERE KeyString=%s and Owner=%s and Domain=%s"
         edit_data = (tag_value, tag_key, owner_id, domain)
-        self.bot.dbconn.execute(edit_command, edit_data)
-        self.bot.dbconn.commit()
+        self.bot.write_queue.put(edit_command, edit_data)
 
 
 def setup(bot):
@@ -1,4 +1,3 @@
-import aiohttp
 from urllib.parse import quote
 from discord.ext import commands
 from discord import Embed
@@ -6,6 +5,7 @@ from constants import *
 import parse
 import utils
 import credentials
+import webclient
 from local_config import *
 
 
@@ -182,15 +182,15 @@ class WebQueries:
                 return
 
             # Query the API and post its response
-            async with aiohttp.ClientSession(headers=HEADERS) as session:
-                async with session.get("http://api.wolframalpha.com/v1/result?appid=" +
-                                       credentials.tokens["WOLFRAMALPHA_APPID"] + "&i=" + quote(message)) as resp:
-                    if resp.status is 501:
-                        await self.bot.say("WolframAlpha could not understand the question '{}' because {}"
-                                           .format(message, resp.reason))
-                        return
-                    data = await resp.content.read()
-                    await self.bot.say(data.decode("utf-8"))
+            async with webclient.client.session.get("http://api.wolframalpha.com/v1/result?appid=" +
+                                                    credentials.tokens["WOLFRAMALPHA_APPID"] + "&i=" +
+                                                    quote(message)) as resp:
+                if resp.status == 501:
+                    await self.bot.say("WolframAlpha could not understand the question '{}' because {}"
+                                       .format(message, resp.reason))
+                    return
+                data = await resp.content.read()
+            await self.bot.say(data.decode("utf-8"))
         except Exception as e:
             await utils.report(self.bot, str(e), source="wolf command", ctx=ctx)
 
@@ -185,7 +185,72 @@ LONG_HELP = {
 # List of reserved list ids
 RESERVED_LIST_IDS = ["BestGirl"]
 
+# List Settings
+LIST_MAX_RESIDENT_USERS = 200                           # Users whose lists are kept in memory
+LIST_UPDATE_DELAY_SECONDS = 1                           # Delay which coalesces list edits into one message update
+
 # Redis Settings
 REDIS_PREFIX = "suitsBot-"                              # Prefix for all keys
 RECENTLY_UNFURLED_TIMEOUT_SECONDS = 300                 # How long to wait before unfurling the same thing again
 UNFURLED_CLEANUP_TRACKING_IN_SECONDS = 60 * 60 * 24     # How long to track messages to cleanup unfurls
+REDIS_MAX_CONNECTIONS = 20                              # Maximum pooled Redis connections
+REDIS_POOL_TIMEOUT_SECONDS = 10                         # How long to wait for a free Redis connection
+
+# Unfurl Settings
+UNFURL_MESSAGE_CONCURRENCY = 5                          # Links fetched at once for a single message
+UNFURL_GLOBAL_CONCURRENCY = 20                          # Links fetched at once across every message
+
+# Message Pipeline Settings
+PIPELINE_WORKERS = 4                                    # Coroutines processing messages, each with its own queue
+PIPELINE_QUEUE_SIZE = 100                               # Messages each worker's queue can hold
+PIPELINE_UNFURL_HIGH_WATER = 50                         # Queue depth at which links stop being unfurled
+PIPELINE_COMMAND_CONCURRENCY = 16                       # Commands run at once, outside the workers
+
+# Error Reporting Settings
+REPORT_FLUSH_SECONDS = 5                                # How long reports wait to be coalesced before sending
+REPORT_MAX_PER_MINUTE = 10                              # Most report messages sent in a minute
+REPORT_MAX_PENDING = 50                                 # Most distinct reports waiting; extras are only counted
+
+# Database Settings
+DB_POOL_MIN_SIZE = 1                                    # Connections opened at start up
+DB_POOL_MAX_SIZE = 5                                    # Maximum connections in use at once
+DB_ACQUIRE_TIMEOUT_SECONDS = 10                         # How long to wait for a free connection
+WRITE_QUEUE_FLUSH_INTERVAL_SECONDS = 0.5                # How often queued database writes are committed
+WRITE_QUEUE_FLUSH_SIZE = 50                             # Queued writes that trigger an immediate commit
+WRITE_QUEUE_MAX_ATTEMPTS = 5                            # Failed statements before a write is dropped
+WRITE_QUEUE_MAX_BACKOFF_SECONDS = 60                    # Longest wait between flushes while the database is down
+WRITE_QUEUE_JOURNAL_PATH = "write_queue.journal"        # File to journal queued writes to (None to disable)
+USER_REGISTRY_FLUSH_SECONDS = 1                         # How often newly seen users are written to the database
+
+# HTTP Client Settings
+HTTP_POOL_LIMIT = 100                                   # Maximum open connections
+HTTP_POOL_LIMIT_PER_HOST = 10                           # Maximum open connections to one host
+HTTP_DNS_CACHE_SECONDS = 300                            # How long DNS lookups are cached
+HTTP_KEEPALIVE_SECONDS = 30                             # How long idle connections are kept for reuse
+HTTP_TIMEOUT_SECONDS = 30                               # Total time a request can take
+
+# Response Cache Settings
+RESPONSE_CACHE_MAX_ENTRIES = 512                        # Web responses held in memory
+RESPONSE_CACHE_USE_REDIS = True                         # Also store responses in Redis so they survive restarts
+RESPONSE_CACHE_TTLS = {                                 # Seconds responses are cached for, by url regex
+    r"https://www\.reddit\.com/r/[^/]+/about\.json": 60 * 60,       # Subreddit details
+    r"https?://(\w+\.)?reddit\.com/r/\w+/comments/": 2 * 60,        # Posts and comments
+    r"https://api\.twitter\.com/1\.1/users/show\.json": 10 * 60,    # Twitter profiles
+    r"https://api\.twitter\.com/1\.1/statuses/show\.json": 5 * 60,  # Tweets
+    r"https?://api\.urbandictionary\.com/": 60 * 60,                # Urban Dictionary definitions
+    r"https?://en\.wikipedia\.org/w/api\.php": 60 * 60,             # Wikipedia searches and articles
+    r"https://graphql\.anilist\.co": 60 * 60,                       # AniList queries
+    r"https://www\.googleapis\.com/youtube/v3/search": 60 * 60,     # YouTube searches
+}
+
+# Image Pool Settings
+UNSPLASH_POOL_PRESET_QUERIES = ["snake"]                # `!picture` searches whose photos are always prefetched
+UNSPLASH_POOL_PROMOTE_AFTER = 3                         # Searches for a term before its photos are prefetched
+UNSPLASH_POOL_MAX_QUERIES = 10                          # Most search terms with prefetched photos
+UNSPLASH_POOL_GATHER_BUDGET = 2                         # Unsplash requests a minute, for each search term
+UNSPLASH_POOL_KEY_TTL_SECONDS = 60 * 60 * 24 * 7        # How long an unused search term's saved photos are kept
+
+# RSS Settings
+RSS_PARSE_WORKERS = 2                                   # Processes used to parse downloaded feeds
+RSS_REFRESH_RETRY_MINUTES = 30                          # How long to wait before retrying a feed that failed to refresh
+RSS_SNAPSHOT_PATH = "rss_snapshot.json.gz"              # File the parsed feeds are saved to, for warm restarts
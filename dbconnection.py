@@ -1,9 +1,10 @@
+import asyncio
 import mysql.connector
 
 
 class DBConnection:
     """
-    Database connection object
+    Database connection pool
 
     Parameters
     ------------
@@ -13,39 +14,107 @@ class DBConnection:
         The password to the database
     database : String
         The name of the database to query
+    min_size : Optional - int
+        The number of connections opened when the pool is created (Default: 1)
+    max_size : Optional - int
+        The maximum number of connections which can be in use at once (Default: 5)
+    acquire_timeout : Optional - float
+        How many seconds to wait for a free connection before raising
+        `asyncio.TimeoutError` (Default: 10)
+    loop : Optional - asyncio event loop
+        The loop the pool runs on. Defaults to the current event loop
 
-    Holds an SQL connection to a database, performs commands, and
-    automatically maintains the connection
+    Holds a pool of SQL connections to a database and performs commands on them.
+    mysql.connector is a blocking library, so every round trip is run in the
+    event loop's executor and awaited, keeping a slow query from stalling the bot.
+    Connections are health checked (and reconnected if needed) when acquired
     """
-    def __init__(self, username, password, database):
+    def __init__(self, username, password, database, min_size=1, max_size=5, acquire_timeout=10, loop=None):
         self._username = username
         self._password = password
         self._database = database
-        self.cnx = mysql.connector.connect(user=username,
-                                           password=password,
-                                           database=database)
-        self.cursor = self.cnx.cursor(buffered=True)
+        self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
 
-    def commit(self):
-        """ Commit the executed commands """
-        self.cnx.commit()
+        self._closed = False
+        self._idle = []  # Open connections not currently in use
+        self._semaphore = asyncio.Semaphore(max_size)
+        for _ in range(min_size):
+            self._idle.append(self._connect())
 
-    def close(self):
-        """ Closes the connection to the database """
-        self.cursor.close()
-        self.cnx.close()
+    def _connect(self):
+        """ Opens a new connection to the database """
+        return mysql.connector.connect(user=self._username,
+                                       password=self._password,
+                                       database=self._database)
 
-    def ensure_sql_connection(self):
-        """ Ensures the database connection is still active and, if not, reconnects """
-        if not self.cnx.is_connected():
-            self.cnx = mysql.connector.connect(user=self._username,
-                                               password=self._password, 
-                                               database=self._database)
-            self.cursor = self.cnx.cursor(buffered=True)
+    def _check(self, cnx):
+        """ Ensures a pooled connection is still active and, if not, reconnects it """
+        if not cnx.is_connected():
+            cnx.reconnect(attempts=3, delay=1)
+        return cnx
 
-    def execute(self, command, data=None):
+    async def run(self, func, *args):
+        """ Runs a blocking function in the executor and returns its result """
+        return await self._loop.run_in_executor(None, func, *args)
+
+    async def acquire(self):
+        """
+        Takes a connection out of the pool, opening a new one if none are idle
+
+        Raises
+        ------------
+        asyncio.TimeoutError - If no connection frees up within `acquire_timeout` seconds
+        RuntimeError - If the pool has been closed
+        """
+        if self._closed:
+            raise RuntimeError("The database connection pool is closed")
+        await asyncio.wait_for(self._semaphore.acquire(), self.acquire_timeout)
+        try:
+            if self._idle:
+                return await self.run(self._check, self._idle.pop())
+            return await self.run(self._connect)
+        except Exception:
+            self._semaphore.release()
+            raise
+
+    def release(self, cnx, discard=False):
+        """
+        Returns a connection to the pool
+
+        Parameters
+        ------------
+        cnx : mysql.connector connection
+            The connection being returned
+        discard : Optional - bool
+            If True, the connection is closed instead of being reused (Default: False)
+        """
+        self._semaphore.release()
+        if discard or self._closed or len(self._idle) >= self.max_size:
+            try:
+                cnx.close()
+            except mysql.connector.Error:
+                pass
+            return
+        self._idle.append(cnx)
+
+    def transaction(self):
+        """
+        Creates a transaction. Use it as an async context manager:
+
+            async with dbconn.transaction() as transaction:
+                await transaction.execute(...)
+
+        Every command is run on the same connection and committed together when
+        the block exits. If the block raises, the commands are rolled back
         """
-        Execute an SQL query with the provided data
+        return Transaction(self)
+
+    async def execute(self, command, data=None):
+        """
+        Execute an SQL command with the provided data and commit it
 
         Parameters
         ------------
@@ -55,9 +124,139 @@ class DBConnection:
             (e.g. 'INSERT INTO Users VALUES (%s, %s)')
         data : (String/Int)
             A tuple containing the data values
+
+        Returns
+        ------------
+        int - The number of rows affected by the command
+        """
+        async with self.transaction() as transaction:
+            return await transaction.execute(command, data)
+
+    async def fetch(self, query, data=None):
+        """
+        Execute an SQL query with the provided data and return the results
+
+        Parameters
+        ------------
+        query : String
+            A string containing the query to execute. Uses the same '%s' syntax as `execute()`
+        data : (String/Int)
+            A tuple containing the data values
+
+        Returns
+        ------------
+        list - Every row returned by the query, as tuples
+        """
+        async with self.transaction() as transaction:
+            return await transaction.fetch(query, data)
+
+    async def close(self):
+        """ Closes every idle connection and stops the pool from handing out new ones """
+        self._closed = True
+        idle = self._idle
+        self._idle = []
+        for cnx in idle:
+            await self.run(cnx.close)
+
+
+class Transaction:
+    """
+    A group of SQL commands run on one pooled connection and committed together
+
+    Created by `DBConnection.transaction()`
+    """
+    def __init__(self, pool):
+        self._pool = pool
+        self._cnx = None
+        self._cursor = None
+        self._running = None  # The last call made on the connection in the executor
+
+    async def __aenter__(self):
+        self._cnx = await self._pool.acquire()
+        self._cursor = self._cnx.cursor(buffered=True)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._running is not None and not self._running.done():
+            # Cancelled while a command was still running in the executor. The connection can't
+            # be rolled back or reused while it is busy, so it is discarded once the command finishes
+            cnx = self._cnx
+            self._running.add_done_callback(lambda _: self._pool.release(cnx, discard=True))
+            return False
+        discard = False
+        try:
+            if exc_type is None:
+                await self._pool.run(self._cnx.commit)
+            else:
+                await self._pool.run(self._cnx.rollback)
+        except mysql.connector.Error:
+            discard = True
+            if exc_type is None:
+                raise
+        finally:
+            if isinstance(exc, (mysql.connector.InterfaceError, mysql.connector.OperationalError)):
+                discard = True
+            self._cursor.close()
+            self._pool.release(self._cnx, discard=discard)
+        return False
+
+    async def execute(self, command, data=None):
+        """
+        Execute an SQL command as part of the transaction
+
+        Returns
+        ------------
+        int - The number of rows affected by the command
+        """
+        return await self._run(_execute, self._cursor, command, data)
+
+    async def executemany(self, command, data):
+        """
+        Execute an SQL command once for every tuple of data values
+
+        Returns
+        ------------
+        int - The number of rows affected by the commands
+        """
+        return await self._run(_executemany, self._cursor, command, data)
+
+    async def fetch(self, query, data=None):
         """
-        if data is None:
-            self.cursor.execute(command)
-        else:
-            self.cursor.execute(command, data)
-        return self.cursor
+        Execute an SQL query as part of the transaction and return the results
+
+        Returns
+        ------------
+        list - Every row returned by the query, as tuples
+        """
+        return await self._run(_fetch, self._cursor, query, data)
+
+    async def _run(self, func, *args):
+        """ Runs a blocking function on the connection in the executor, keeping track of it even if cancelled """
+        self._running = asyncio.ensure_future(self._pool.run(func, *args))
+        return await asyncio.shield(self._running)
+
+
+# ------------------------------------------------------------------------ Executor functions
+
+def _execute(cursor, command, data):
+    """ Runs a command on the cursor and returns the number of affected rows """
+    if data is None:
+        cursor.execute(command)
+    else:
+        cursor.execute(command, data)
+    return cursor.rowcount
+
+
+def _executemany(cursor, command, data):
+    """ Runs a command for every tuple of data and returns the number of affected rows """
+    cursor.executemany(command, data)
+    return cursor.rowcount
+
+
+def _fetch(cursor, query, data):
+    """ Runs a query on the cursor and returns every row """
+    if data is None:
+        cursor.execute(query)
+    else:
+        cursor.execute(query, data)
+    return cursor.fetchall()
@@ -1,55 +1,54 @@
-import json
+import asyncio
 from datetime import datetime
-from typing import List, Callable, Optional, Union
+from typing import List, Callable, Optional, Tuple, Union
 from bs4 import BeautifulSoup
 from discord import Embed, Message
 from constants import *
 from credentials import tokens
 import utils
-import redis
+from singleflight import coalesce
+from redisconnection import redis_db
 
-redis_db = redis.StrictRedis(host='localhost', charset="utf-8", decode_responses=True)
+# Bounds the number of unfurl fetches running at once, across every message
+unfurl_semaphore = asyncio.Semaphore(UNFURL_GLOBAL_CONCURRENCY)
 
 
 async def recently_unfurled(key: str) -> bool:
-    """Check if key exists, if not set it."""
-    key_to_check = f"{REDIS_PREFIX}{key}"
-    if redis_db.exists(key_to_check):
-        return True
-    else:
-        redis_db.set(key_to_check, "", RECENTLY_UNFURLED_TIMEOUT_SECONDS)
-        return False
+    """Check if key exists, if not set it. The check and set are one atomic command"""
+    was_set = await redis_db.set(f"{REDIS_PREFIX}{key}", "", ex=RECENTLY_UNFURLED_TIMEOUT_SECONDS, nx=True)
+    return not was_set
 
 
-async def embeds_from_regex(matchlist: List[str],
-                            embed_method: Callable[[str], Union[List[Embed], Embed, None]],
-                            message: Message) -> List[Embed]:
+async def generate_embeds(unfurls: List[Tuple[str, str, Callable[[str], Union[List[Embed], Embed, None]]]]
+                          ) -> List[Union[List[Embed], Exception]]:
     """
-    Returns a list of embeds generated from a list of strings and
-    a method used to convert those strings into embeds
-    :param matchlist: The list of strings to convert
-    :param embed_method: A method which takes a string (normally a url or id)
-    and converts it into an embed or list of embeds
-    :param message: The message triggering this embed response
-    :return: A list of embeds
+    Generates the embeds for several links at once
+
+    Every link is fetched concurrently, bounded by UNFURL_MESSAGE_CONCURRENCY fetches for this call
+    and UNFURL_GLOBAL_CONCURRENCY fetches across the bot. Links unfurled in the last
+    RECENTLY_UNFURLED_TIMEOUT_SECONDS are skipped
+    :param unfurls: A list of (dedupe key, link, embed method) tuples. The embed method takes
+    the link (normally a url or id) and converts it into an embed or list of embeds
+    :return: For each unfurl, in the order given, the list of embeds it generated
+    (empty if there were none) or the exception raised while generating them
     """
-    embed_list = list()
-    for match in matchlist:
-        link = match.strip()
-        if await recently_unfurled(f"{message.channel.id}-{embed_method.__name__}-{link}"):
-            continue
-        embed = await embed_method(link)
-        if embed is not None:
-            if isinstance(embed, list):
-                for item in embed:
-                    embed_list.append(item)
-            else:
-                embed_list.append(embed)
-    return embed_list
+    message_semaphore = asyncio.Semaphore(UNFURL_MESSAGE_CONCURRENCY)
+
+    async def generate(dedupe_key, link, embed_method):
+        if await recently_unfurled(dedupe_key):
+            return []
+        async with message_semaphore:
+            async with unfurl_semaphore:
+                embed = await embed_method(link)
+        if embed is None:
+            return []
+        return embed if isinstance(embed, list) else [embed]
+
+    return await asyncio.gather(*[generate(*unfurl) for unfurl in unfurls], return_exceptions=True)
 
 
 def get_trig_message_key(message_id: int) -> str:
-    return f"{REDIS_PREFIX}trig-message-{message_id}"
+    return f"{REDIS_PREFIX}trig-messages-{message_id}"
 
 
 def get_unfurl_message_key(message_id: int) -> str:
@@ -59,31 +58,29 @@ def get_unfurl_message_key(message_id: int) -> str:
 async def get_unfurls_for_trigger_message(trigger_message: Message) -> List[str]:
     """Retrieve all messages IDs created from trigger message"""
     trig_message_key = get_trig_message_key(trigger_message.id)
-    trig_message_value = redis_db.get(trig_message_key)
-    if trig_message_value:
-        return json.loads(trig_message_value)
-    else:
-        return []
+    return await redis_db.lrange(trig_message_key, 0, -1)
 
 
 async def get_author_for_unfurl_message(unfurl_message: Message) -> Optional[str]:
     """Retrieve author for unfurled message"""
     unfurl_message_key = get_unfurl_message_key(unfurl_message.id)
-    return redis_db.get(unfurl_message_key)
+    return await redis_db.get(unfurl_message_key)
 
 
 async def record_unfurl(trigger_message: Message, unfurl_message: Message) -> None:
-    """Record data about unfurled messages"""
+    """Record data about unfurled messages, in a single round trip"""
+    pipe = redis_db.pipeline(transaction=False)
 
     # Record unfurled message triggering message as trigger_message_id: [unfurl_message_id, ...]
     trig_message_key = get_trig_message_key(trigger_message.id)
-    unfurl_messages = await get_unfurls_for_trigger_message(trigger_message)
-    unfurl_messages.append(unfurl_message.id)
-    redis_db.set(trig_message_key, json.dumps(unfurl_messages), UNFURLED_CLEANUP_TRACKING_IN_SECONDS)
+    pipe.rpush(trig_message_key, unfurl_message.id)
+    pipe.expire(trig_message_key, UNFURLED_CLEANUP_TRACKING_IN_SECONDS)
 
     # Record unfurled message triggering author as unfurl_message_id: author_id
     unfurl_message_key = get_unfurl_message_key(unfurl_message.id)
-    redis_db.set(unfurl_message_key, trigger_message.author.id, UNFURLED_CLEANUP_TRACKING_IN_SECONDS)
+    pipe.set(unfurl_message_key, trigger_message.author.id, ex=UNFURLED_CLEANUP_TRACKING_IN_SECONDS)
+
+    await pipe.execute()
 
 
 async def amazon(url: str) -> Optional[Embed]:
@@ -238,6 +235,7 @@ async def subreddit(subname: str, allow_nsfw: bool = True) -> Optional[Embed]:
     return subembed
 
 
+@coalesce
 async def reddit_post(post_url: str) -> Optional[Embed]:
     """
 
@@ -459,6 +457,7 @@ async def twitter_images(image_id):
     return embed_list[1:] if count else None  # Drop the last since we only care about showing the hidden images
 
 
+@coalesce
 async def twitter_response(tweet_id: Union[str, int]) -> Optional[List[Embed]]:
     """
     Provided the id for a tweet, returns an embed with the
@@ -36,6 +36,51 @@ class Regex:
         """
         return self.url.fullmatch(string) is not None
 
+    def scan(self, message):
+        """
+        Finds every link the bot can unfurl in a single pass over the message
+
+        Most messages contain no links at all, so each pattern is only run if a cheap
+        substring check shows the message could contain a match for it. The matches
+        are identical to those of the `find_*` methods
+
+        Parameters
+        -------------
+        message : str
+            The message content
+
+        Returns
+        -------------
+        A dictionary mapping each kind of link found ("subreddit", "post", "comment",
+        "twitter_id", "amazon" or "newegg") to a list of its matches.
+        Kinds with no matches are left out
+        """
+        found = {}
+        if "r/" in message:
+            matches = self.find_subreddits(message)
+            if matches:
+                found["subreddit"] = matches
+        if "://" not in message:  # Every other kind is a url
+            return found
+        if "reddit" in message:
+            for (kind, find) in [("post", self.find_posts), ("comment", self.find_comments)]:
+                matches = find(message)
+                if matches:
+                    found[kind] = matches
+        if "twitter.com/" in message:
+            matches = self.find_twitter_id(message)
+            if matches:
+                found["twitter_id"] = matches
+        if "amazon.com/" in message:
+            matches = self.find_amazon(message)
+            if matches:
+                found["amazon"] = matches
+        if "newegg.com/" in message.lower():
+            matches = self.find_newegg(message)
+            if matches:
+                found["newegg"] = matches
+        return found
+
     # Reddit
 
     def find_comments(self, message):
@@ -0,0 +1,145 @@
+import asyncio
+import time
+import utils
+
+
+class MessagePipeline:
+    """
+    Processes incoming messages on a fixed pool of worker coroutines
+
+    Each worker has its own bounded queue, and every message from a channel goes to the
+    same worker, so a channel's messages are always handled in the order they arrived.
+    When a queue is full, messages which aren't commands are dropped, while commands wait
+    for space. When a queue is backed up past `unfurl_high_water` messages, the handler is
+    told to skip link unfurling, which is the most expensive (and most spammable) work
+
+    Commands can take a long time (e.g. waiting for a reaction), so they aren't run by the
+    workers. Once the handler has dealt with a command message, the command is run as its own
+    task, and at most `command_concurrency` commands run at once. A channel's commands still
+    run one at a time, in the order they arrived
+
+    Parameters
+    ------------
+    bot : discord.bot object
+        The bot object, used for reporting errors
+    handler : Coroutine function
+        Called as `handler(message, shed_unfurls)` for every message. Returns True if the
+        message may be run as a command
+    command_handler : Coroutine function
+        Called as `command_handler(message)` to run a command
+    workers : Optional - int
+        The number of worker coroutines (Default: 4)
+    queue_size : Optional - int
+        The number of messages each worker's queue can hold (Default: 100)
+    unfurl_high_water : Optional - int
+        The queue depth at which unfurls are shed (Default: 50)
+    command_concurrency : Optional - int
+        The number of commands which can run at once (Default: 16)
+    """
+    def __init__(self, bot, handler, command_handler, workers=4, queue_size=100, unfurl_high_water=50,
+                 command_concurrency=16):
+        self.bot = bot
+        self.handler = handler
+        self.command_handler = command_handler
+        self.queue_size = queue_size
+        self.unfurl_high_water = unfurl_high_water
+
+        self._queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._workers = [bot.loop.create_task(self._work(queue)) for queue in self._queues]
+        self._command_slots = asyncio.Semaphore(command_concurrency)
+        self._commands = set()  # Command tasks which haven't finished
+        self._last_commands = {}  # Maps a channel id to its most recently started command task
+
+        # Metrics
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0  # Messages dropped because their queue was full
+        self.shed = 0  # Messages handled without unfurling links
+        self.total_wait = 0  # Seconds messages spent queued, in total
+        self.max_wait = 0  # The longest a message has spent queued
+        self.commands = 0  # Commands started
+
+    async def submit(self, message, is_command=False):
+        """
+        Queues a message for processing
+
+        Parameters
+        ------------
+        message : discord.Message
+            The message
+        is_command : Optional - bool
+            If True, the message waits for space when its queue is full instead of being dropped,
+            and is run as a command once handled (Default: False)
+        """
+        self.received += 1
+        queue = self._queues[hash(message.channel.id) % len(self._queues)]
+        item = (message, is_command, time.monotonic())
+        if is_command:
+            await queue.put(item)
+            return
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    def close(self):
+        """ Stops the workers and any running commands. Queued messages are discarded """
+        for worker in self._workers:
+            worker.cancel()
+        for command in self._commands:
+            command.cancel()
+
+    def stats(self):
+        """ Returns a dictionary of the pipeline's metrics for displaying """
+        depths = [queue.qsize() for queue in self._queues]
+        average_wait = self.total_wait / self.processed if self.processed else 0
+        return {"Queue depth": f"{sum(depths)} ({' / '.join(str(depth) for depth in depths)} of {self.queue_size})",
+                "Received": str(self.received),
+                "Processed": str(self.processed),
+                "Dropped": str(self.dropped),
+                "Unfurls shed": str(self.shed),
+                "Commands": f"{self.commands} ({len(self._commands)} running or waiting)",
+                "Wait time": f"{average_wait * 1000:.1f} ms average, {self.max_wait * 1000:.1f} ms max"}
+
+    async def _work(self, queue):
+        """ Handles the messages in a queue, one at a time """
+        while True:
+            (message, is_command, queued_at) = await queue.get()
+            wait = time.monotonic() - queued_at
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            shed_unfurls = queue.qsize() >= self.unfurl_high_water
+            if shed_unfurls:
+                self.shed += 1
+            try:
+                if await self.handler(message, shed_unfurls) and is_command:
+                    self.commands += 1
+                    channel_id = message.channel.id
+                    previous = self._last_commands.get(channel_id)
+                    command = self.bot.loop.create_task(self._run_command(message, previous))
+                    self._commands.add(command)
+                    self._last_commands[channel_id] = command
+                    command.add_done_callback(lambda task, channel_id=channel_id: self._command_done(task, channel_id))
+            except Exception as e:
+                await utils.report(self.bot, str(e), source="MessagePipeline worker")
+            finally:
+                self.processed += 1
+                queue.task_done()
+
+    def _command_done(self, command, channel_id):
+        self._commands.discard(command)
+        if self._last_commands.get(channel_id) is command:
+            del self._last_commands[channel_id]
+
+    async def _run_command(self, message, previous):
+        """
+        Runs a command once the channel's previous command has finished,
+        and fewer than `command_concurrency` commands are running
+        """
+        if previous is not None:
+            await asyncio.wait([previous])  # Doesn't raise if the previous command failed
+        async with self._command_slots:
+            try:
+                await self.command_handler(message)
+            except Exception as e:
+                await utils.report(self.bot, str(e), source="MessagePipeline command")
@@ -0,0 +1,22 @@
+"""
+The bot's shared Redis client
+
+Commands are awaited instead of blocking the event loop, and connections are
+pooled, so concurrent unfurls and cache lookups don't wait on each other.
+Batch related commands into one round trip with `redis_db.pipeline()`
+"""
+import redis.asyncio as aioredis
+from constants import *
+
+# When every connection is in use, commands wait for one to be released instead of failing
+pool = aioredis.BlockingConnectionPool(host='localhost',
+                                       max_connections=REDIS_MAX_CONNECTIONS,
+                                       timeout=REDIS_POOL_TIMEOUT_SECONDS,
+                                       encoding="utf-8",
+                                       decode_responses=True)
+redis_db = aioredis.Redis(connection_pool=pool)
+
+
+async def close():
+    """ Closes every pooled connection. Call this before shutting down """
+    await pool.disconnect()
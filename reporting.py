@@ -0,0 +1,111 @@
+import asyncio
+from collections import deque, OrderedDict
+import time
+import utils
+
+
+class ReportAggregator:
+    """
+    Batches the error reports and alerts sent to the dev channels
+
+    Reports are held for up to `flush_interval` seconds before being sent. Reports with the
+    same fingerprint (e.g. the same source failing with the same exception) are coalesced
+    while they wait, and sent as a single message noting how many times they occurred.
+    At most `max_per_minute` messages are sent a minute; anything over the limit waits for
+    a later flush, so a failing upstream can't spend the bot's rate limit on alerts
+
+    Parameters
+    ------------
+    bot : discord.bot object
+        The bot object for sending the messages
+    flush_interval : Optional - float
+        The number of seconds between flushes (Default: 5)
+    max_per_minute : Optional - int
+        The maximum number of messages sent in any minute (Default: 10)
+    max_pending : Optional - int
+        The maximum number of distinct reports waiting to be sent. Reports beyond this
+        are counted and summarized instead (Default: 50)
+    """
+    def __init__(self, bot, flush_interval=5, max_per_minute=10, max_pending=50):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.max_per_minute = max_per_minute
+        self.max_pending = max_pending
+
+        self._pending = OrderedDict()  # Maps a fingerprint to [channel attribute, content, embed, count, last seen]
+        self._sent = deque()  # When each message in the last minute was sent
+        self.suppressed = 0  # Reports dropped because too many were waiting
+        self._flush_task = bot.loop.create_task(self._flush_loop())
+
+    def submit(self, channel, fingerprint, content=None, embed=None):
+        """
+        Queues a report
+
+        Parameters
+        ------------
+        channel : str
+            The name of the bot attribute holding the channel to send to (e.g. "ERROR_CHANNEL").
+            It is looked up when the report is sent, so reports made before the bot is ready aren't lost
+        fingerprint : Hashable
+            Identifies repeats of the same report
+        content : Optional - str
+            The text of the message
+        embed : Optional - Embed
+            The embed of the message
+        """
+        report = self._pending.get(fingerprint)
+        if report is not None:
+            report[3] += 1
+            report[4] = utils.currtime()
+            return
+        if len(self._pending) >= self.max_pending:
+            self.suppressed += 1
+            return
+        self._pending[fingerprint] = [channel, content, embed, 1, None]
+
+    async def flush(self):
+        """ Sends the waiting reports, as far as the rate limit allows """
+        now = time.monotonic()
+        while self._sent and now - self._sent[0] > 60:
+            self._sent.popleft()
+
+        while self._pending and len(self._sent) < self.max_per_minute:
+            (fingerprint, report) = next(iter(self._pending.items()))
+            (channel_name, content, embed, count, last_seen) = report
+            channel = getattr(self.bot, channel_name, None)
+            if channel is None:  # The bot isn't ready yet
+                return
+            del self._pending[fingerprint]
+            if count > 1:
+                occurrences = f"x{count} occurrences (last at {last_seen})"
+                if embed is not None:
+                    embed.add_field(name="Occurrences", value=occurrences, inline=False)
+                else:
+                    content += f"\n*{occurrences}*"
+            await self._send(channel, content, embed)
+
+        if self.suppressed and len(self._sent) < self.max_per_minute:
+            channel = getattr(self.bot, "ERROR_CHANNEL", None)
+            if channel is not None:
+                suppressed = self.suppressed
+                self.suppressed = 0
+                await self._send(channel, f"**Alert:** {suppressed} further reports were suppressed", None)
+
+    async def close(self):
+        """ Stops the flush timer and sends what the rate limit allows. Call this before shutting down """
+        self._flush_task.cancel()
+        await self.flush()
+
+    async def _send(self, channel, content, embed):
+        self._sent.append(time.monotonic())
+        try:
+            await self.bot.send_message(channel, content, embed=embed)
+        except Exception as e:
+            # Reporting the failure would only queue another report, so print it instead
+            print(f"Failed to send report: {e}")
+
+    async def _flush_loop(self):
+        """ Flushes the reports every `flush_interval` seconds """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
@@ -0,0 +1,163 @@
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import time
+import redis
+from constants import *
+import redisconnection
+
+
+class ResponseCache:
+    """
+    An in-memory LRU cache of web responses, optionally backed by Redis
+
+    Only endpoints with a TTL rule are cached, so endpoints which are meant to return
+    something different every time (random images, etc.) are never served stale.
+    Cached values are shared between callers and should be treated as read-only
+
+    Parameters
+    ------------
+    ttls : {str: int}
+        Maps a regex, matched against the start of a url, to the number of seconds
+        responses from matching urls are cached for. The first matching rule is used
+    max_entries : Optional - int
+        The number of responses held in memory before the least recently used one is evicted (Default: 512)
+    redis_db : Optional - redis.asyncio.Redis
+        An async Redis client to store responses in, so they survive restarts.
+        If None, responses are only held in memory (Default: None)
+    """
+    def __init__(self, ttls, max_entries=512, redis_db=None):
+        self.rules = [(re.compile(pattern), ttl) for (pattern, ttl) in ttls.items()]
+        self.max_entries = max_entries
+        self.redis_db = redis_db
+
+        self._entries = OrderedDict()  # Maps a key to (expiry time, value), least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+        self.redis_errors = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(method, url, params=None, body=None):
+        """
+        Creates the cache key for a request
+
+        Parameters
+        ------------
+        method : str
+            The HTTP method (e.g. "GET")
+        url : str
+            The requested url
+        params : Optional - dict{str:str}
+            The url parameters of the request
+        body : Optional - Any
+            The JSON body of the request
+
+        Returns
+        ------------
+        str - A key unique to the request
+        """
+        params = "&".join(f"{k}={v}" for (k, v) in sorted((params or {}).items()))
+        body = "" if body is None else json.dumps(body, sort_keys=True)
+        body_hash = hashlib.sha1(body.encode("utf-8")).hexdigest()
+        return f"{method} {url}?{params} {body_hash}"
+
+    def ttl_for(self, url):
+        """ Returns how many seconds responses from a url are cached for, or 0 if they aren't cached """
+        for (pattern, ttl) in self.rules:
+            if pattern.match(url):
+                return ttl
+        return 0
+
+    async def get(self, key):
+        """
+        Looks up a cached response
+
+        Returns
+        ------------
+        The cached value, or None if there is no unexpired value for the key
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        if self.redis_db is not None:
+            stored = await self._redis(self.redis_db.get(self._redis_key(key)))
+            if stored is not None:
+                stored = json.loads(stored)
+                self._store(key, stored["expires"], stored["value"])
+                self.hits += 1
+                self.redis_hits += 1
+                return stored["value"]
+
+        self.misses += 1
+        return None
+
+    async def set(self, key, value, ttl):
+        """
+        Caches a response
+
+        Parameters
+        ------------
+        key : str
+            The key created by `key()`
+        value : Any
+            The response. Must be JSON serializable if Redis is used
+        ttl : int
+            How many seconds to cache the response for
+        """
+        expires = time.time() + ttl
+        self._store(key, expires, value)
+        if self.redis_db is not None:
+            stored = json.dumps({"expires": expires, "value": value})
+            await self._redis(self.redis_db.set(self._redis_key(key), stored, ex=ttl))
+
+    def clear(self):
+        """ Empties the in-memory cache """
+        self._entries.clear()
+
+    def stats(self):
+        """ Returns a dictionary of the cache's counters for displaying """
+        lookups = self.hits + self.misses
+        hit_rate = f"{100 * self.hits / lookups:.1f}%" if lookups else "-"
+        return {"Entries": f"{len(self._entries)} / {self.max_entries}",
+                "Hits": f"{self.hits} ({self.redis_hits} from Redis)",
+                "Misses": str(self.misses),
+                "Hit rate": hit_rate,
+                "Evictions": str(self.evictions),
+                "Redis errors": str(self.redis_errors)}
+
+    def _store(self, key, expires, value):
+        """ Adds an entry to memory, evicting the least recently used entry if the cache is full """
+        self._entries[key] = (expires, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _redis_key(key):
+        return f"{REDIS_PREFIX}http-{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+    async def _redis(self, command):
+        """ Awaits a Redis command. A Redis failure is treated as a cache miss """
+        try:
+            return await command
+        except redis.RedisError:
+            self.redis_errors += 1
+            return None
+
+
+# The cache every web request is checked against
+cache = ResponseCache(RESPONSE_CACHE_TTLS,
+                      max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                      redis_db=redisconnection.redis_db if RESPONSE_CACHE_USE_REDIS else None)
@@ -71,6 +71,13 @@ class Scheduler:
         else:
             self._yearly.append(task)
 
+    def remove_task(self, task):
+        """ Unschedules a task from every task group it was added to """
+        for group in [self._minutely, self._hourly, self._daily, self._weekly, self._monthly, self._yearly,
+                      self._daily_midnight, self._weekly_midnight, self._monthly_midnight, self._yearly_midnight]:
+            while task in group:
+                group.remove(task)
+
     # =============================================================== Execute Task Groups
 
     async def _run_minutely(self, currtime):
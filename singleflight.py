@@ -0,0 +1,64 @@
+import asyncio
+import functools
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same resource
+
+    While a call for a key is in flight, any other caller asking for the same key
+    awaits the first call's result instead of starting a request of its own.
+    Once the call finishes the key is forgotten, so results are never reused
+    after the fact (that is the response cache's job)
+    """
+    def __init__(self):
+        self._calls = {}  # Maps a key to the future of its in-flight call
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Runs a coroutine function, or joins the call already in flight for the key
+
+        Parameters
+        ------------
+        key : Hashable
+            Identifies the resource being fetched
+        func : Coroutine function
+            The function which fetches the resource
+        *args, **kwargs
+            Passed to func
+
+        Returns
+        ------------
+        The result of the call. If the call raises, every caller sharing it receives the exception
+        """
+        future = self._calls.get(key)
+        if future is None:
+            self.calls += 1
+            future = asyncio.ensure_future(func(*args, **kwargs))
+            self._calls[key] = future
+            future.add_done_callback(functools.partial(self._forget, key))
+        else:
+            self.coalesced += 1
+        # Shielded so a caller being cancelled doesn't cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+
+def coalesce(func):
+    """
+    Decorates a coroutine function so concurrent calls with the same
+    positional arguments share one in-flight call
+    """
+    group = SingleFlight()
+
+    @functools.wraps(func)
+    async def wrapper(*args):
+        return await group.do(args, func, *args)
+
+    wrapper.single_flight = group
+    return wrapper
@@ -1,4 +1,10 @@
-import redis
+import asyncio
+from collections import deque, OrderedDict
+from datetime import datetime, timezone
+import math
+import time
+import redisconnection
+from singleflight import SingleFlight
 import utils
 
 
@@ -12,58 +18,140 @@ class StringCache:
 
     NOTE: If the cache runs out, it will supply the only remaining value repeatedly
     until it can fill itself
+
+    The queue is stored as a Redis list. Values are taken from the in-memory copy,
+    and only the changes (values taken and values added) are written back to Redis,
+    in the background, so taking a value never waits on the database
+
+    The refill threshold and target grow with demand. The rate values are taken at is
+    tracked as an exponential moving average, and the cache refills early enough to
+    cover that rate for as long as a refill takes, and deep enough to cover it for
+    `refill_horizon` seconds. Calls to `gather()` are capped at `gather_budget` a
+    minute, so a burst of requests can't run up the API being gathered from
     """
 
-    CACHE_DELIMITER = "\n"
-    DB_KEY_PREFIX = "STRING-CACHE-QUEUE-"
+    CACHE_DELIMITER = "\n"  # Separated the values in the legacy string format
+    DB_KEY_PREFIX = "STRING-CACHE-LIST-"
+    LEGACY_DB_KEY_PREFIX = "STRING-CACHE-QUEUE-"
+    MAX_INTERVAL = 600  # Longest gap between values counted towards the consumption rate, in seconds
 
-    def __init__(self, bot, cache_id, fill_size=10, fill_threshold=3, gather_limit=5):
+    caches = {}  # Every StringCache, by cache id, for reporting
+
+    def __init__(self, bot, cache_id, fill_size=10, fill_threshold=3, gather_limit=5,
+                 max_fill_size=50, gather_budget=10, refill_horizon=60, smoothing=0.2, key_ttl=None):
         """
-        Creates a StringCache, loads the saved queue from the database (if it exists)
+        Creates a StringCache, and starts loading the saved queue from the database (if it exists)
+        and filling it if it is running low
 
         :param bot: The bot object (contains important properties like the async event loop)
         :param cache_id: The key for storing this queue in the database
             NOTE: If this key is not unique between caches, they will overwrite each other
-            NOTE: This key is not used 'as is'. It is prepended with 'STRING-CACHE-QUEUE-' to
+            NOTE: This key is not used 'as is'. It is prepended with 'STRING-CACHE-LIST-' to
             help ensure no collisions with any existing database keys
-        :param fill_size: The size the queue will be filled to (Default: 10)
+        :param fill_size: The smallest size the queue will be filled to (Default: 10)
             NOTE: depending on implementation of fill(), this value may be exceeded
-        :param fill_threshold: The size limit that triggers a refill (Default: 3)
+        :param fill_threshold: The smallest size limit that triggers a refill (Default: 3)
         :param gather_limit: The maximum number of gather() attempts to make while filling (Default: 5)
+        :param max_fill_size: The largest size the queue will be filled to under heavy demand (Default: 50)
+        :param gather_budget: The maximum number of gather() calls in any minute (Default: 10)
+        :param refill_horizon: How many seconds of demand a refill should cover (Default: 60)
+        :param smoothing: The weight of the newest interval in the consumption rate average (Default: 0.2)
+        :param key_ttl: If set, the saved queue expires after this many seconds without being loaded or
+            written, so caches which are created on demand don't stay in the database forever (Default: None)
         """
         self.bot = bot
         self.cache_id = cache_id
         self.fill_size = fill_size
         self.fill_threshold = fill_threshold
         self.gather_limit = gather_limit
+        self.max_fill_size = max_fill_size
+        self.gather_budget = gather_budget
+        self.refill_horizon = refill_horizon
+        self.smoothing = smoothing
+        self.key_ttl = key_ttl
+
+        # Demand tracking
+        self._interval_average = None  # Average seconds between values being taken
+        self._last_taken = None
+        self._gather_average = None  # Average seconds a call to gather() takes
+        self._gather_times = deque()  # When each gather() call in the last minute started
+
+        # Metrics
+        self.served = 0
+        self.stale_serves = 0  # Values served again because the cache was down to its last value
+        self.empty_serves = 0  # Requests made while the cache was empty
+        self.gathers = 0
+        self.budget_exhausted = 0  # Fills cut short by the gather budget
 
         self._locked = False
         self._loop = bot.loop
-        self._redis_db = redis.StrictRedis(host='localhost', charset="utf-8", decode_responses=True)
-        self._queue = []
-        # Load saved queue
-        cached_list = self._redis_db.get(StringCache.DB_KEY_PREFIX + self.cache_id)
-        if cached_list:
-            self._queue = cached_list.split(StringCache.CACHE_DELIMITER)
+        self._redis_db = redisconnection.redis_db
+        self._db_key = StringCache.DB_KEY_PREFIX + self.cache_id
+        self._queue = deque()
+        self._loaded = asyncio.Event()
+
+        # Changes which haven't been written to the database yet
+        self._popped = 0
+        self._pushed = []
+        self._saving = False
+
+        StringCache.caches[cache_id] = self
+        self._loop.create_task(self._load())
 
     def __len__(self):
         return len(self._queue)
 
+    @property
+    def rate(self) -> float:
+        """ The estimated number of values taken per second """
+        if self._interval_average is None:
+            return 0
+        # A long silence since the last value lowers the estimate, even before the next value is taken
+        interval = max(self._interval_average, min(time.monotonic() - self._last_taken, StringCache.MAX_INTERVAL))
+        return 1 / interval if interval > 0 else 0
+
+    @property
+    def low_water(self) -> int:
+        """ The queue size that triggers a refill: enough to last through a refill at the current rate """
+        refill_seconds = self._gather_average or 0
+        return max(self.fill_threshold, min(math.ceil(2 * self.rate * refill_seconds), self.max_fill_size // 2))
+
+    @property
+    def target(self) -> int:
+        """ The queue size a refill aims for: enough to last `refill_horizon` seconds at the current rate """
+        demand = self.low_water + math.ceil(self.rate * self.refill_horizon)
+        return max(self.fill_size, min(demand, self.max_fill_size))
+
     def next(self) -> str:
         """ Returns the next value in the cache. Returns 'None' if cache is empty """
+        self._record_take()
         if len(self._queue) == 0:  # Return None if cache is empty
             url = None
+            self.empty_serves += 1
         elif len(self._queue) == 1:  # If only one item left in cache, return it but do not remove it
             url = self._queue[0]
+            self.stale_serves += 1
         else:  # Pop the next item off the queue and update the database
-            url = self._queue.pop(0)
+            url = self._queue.popleft()
+            self._popped += 1
             self._save()
 
-        # Fill cache if queue is running low
-        if len(self) < self.fill_threshold:
+        # Fill cache if queue is running low, and the gather budget allows it
+        if len(self) < self.low_water and self._within_budget():
             self.fill()
         return url
 
+    def stats(self) -> dict:
+        """ Returns a dictionary of the cache's metrics for displaying """
+        return {"Size": f"{len(self)} (refills below {self.low_water}, up to {self.target})",
+                "Demand": f"{self.rate * 60:.1f} per minute",
+                "Served": str(self.served),
+                "Stale serves": str(self.stale_serves),
+                "Empty serves": str(self.empty_serves),
+                "Gathers": f"{self.gathers} ({len(self._gather_times)} in the last minute, "
+                           f"budget {self.gather_budget})",
+                "Budget exhausted": str(self.budget_exhausted)}
+
     def fill(self):
         """ A function which creates an async task to fill up the cache """
         self._loop.create_task(self._fill())
@@ -77,11 +165,97 @@ class StringCache:
         """
         raise NotImplementedError
 
+    def _record_take(self) -> None:
+        """ Updates the consumption rate average with the time since the last value was taken """
+        now = time.monotonic()
+        self.served += 1
+        if self._last_taken is not None:
+            interval = min(now - self._last_taken, StringCache.MAX_INTERVAL)
+            if self._interval_average is None:
+                self._interval_average = interval
+            else:
+                self._interval_average += self.smoothing * (interval - self._interval_average)
+        self._last_taken = now
+
+    def _within_budget(self) -> bool:
+        """ Checks whether another gather() call fits in the per-minute budget """
+        now = time.monotonic()
+        while self._gather_times and now - self._gather_times[0] > 60:
+            self._gather_times.popleft()
+        return len(self._gather_times) < self.gather_budget
+
+    async def _gather_timed(self) -> list:
+        """ Calls gather(), recording the call against the budget and its duration in the average """
+        start = time.monotonic()
+        self._gather_times.append(start)
+        self.gathers += 1
+        values = await self.gather()
+        duration = time.monotonic() - start
+        if self._gather_average is None:
+            self._gather_average = duration
+        else:
+            self._gather_average += self.smoothing * (duration - self._gather_average)
+        return values
+
+    async def _load(self) -> None:
+        """ Loads the saved queue from the database, converting it from the legacy string format if needed """
+        try:
+            cached_list = await self._redis_db.lrange(self._db_key, 0, -1)
+            if not cached_list:
+                legacy_key = StringCache.LEGACY_DB_KEY_PREFIX + self.cache_id
+                legacy_value = await self._redis_db.get(legacy_key)
+                if legacy_value:
+                    cached_list = legacy_value.split(StringCache.CACHE_DELIMITER)
+                    async with self._redis_db.pipeline(transaction=True) as pipe:
+                        pipe.rpush(self._db_key, *cached_list)
+                        pipe.delete(legacy_key)
+                        await pipe.execute()
+            if cached_list and self.key_ttl is not None:
+                await self._redis_db.expire(self._db_key, self.key_ttl)
+            self._queue.extendleft(reversed(cached_list))  # Ahead of anything added while loading
+        except Exception as e:
+            await utils.report(self.bot, f"Failed to load StringCache `{self.cache_id}`\n" + str(e))
+        finally:
+            self._loaded.set()
+        # Prefetch, rather than waiting for the first request to find the cache empty
+        if len(self._queue) < self.low_water:
+            self.fill()
+
     def _save(self) -> None:
-        """ Save the current queue to the database """
-        db_key = StringCache.DB_KEY_PREFIX + self.cache_id
-        db_value = StringCache.CACHE_DELIMITER.join(self._queue)
-        self._redis_db.set(db_key, db_value)
+        """ Schedules the changes to the queue to be written to the database, if a write isn't already running """
+        if not self._saving:
+            self._saving = True
+            self._loop.create_task(self._write_changes())
+
+    async def _write_changes(self) -> None:
+        """
+        Writes the values added to and taken from the queue to the database, until there are no
+        changes left. Changes made while a write is in flight are batched into the next write
+        """
+        try:
+            await self._loaded.wait()
+            while self._popped or self._pushed:
+                (popped, pushed) = (self._popped, self._pushed)
+                (self._popped, self._pushed) = (0, [])
+                # Push before trimming, in case values added since the last write have already been taken
+                try:
+                    async with self._redis_db.pipeline(transaction=True) as pipe:
+                        if pushed:
+                            pipe.rpush(self._db_key, *pushed)
+                        if popped:
+                            pipe.ltrim(self._db_key, popped, -1)
+                        if self.key_ttl is not None:
+                            pipe.expire(self._db_key, self.key_ttl)
+                        await pipe.execute()
+                except Exception:
+                    # Keep the changes for the next write, ahead of any made since
+                    self._popped += popped
+                    self._pushed = pushed + self._pushed
+                    raise
+        except Exception as e:
+            await utils.report(self.bot, f"Failed to save StringCache `{self.cache_id}`\n" + str(e))
+        finally:
+            self._saving = False
 
     async def _fill(self) -> None:
         """
@@ -94,27 +268,156 @@ class StringCache:
                 print(f"Cache {self.cache_id} locked. Abandoning `_fill()`")
                 return
             self._locked = True  # Lock fetching to prevent concurrent fetching
+            await self._loaded.wait()  # Don't fetch values the saved queue already has
             print(f"Filling cache `{self.cache_id}`...")
             # Gather values
             gather_count = 0
-            while len(self._queue) < self.fill_size and gather_count < self.gather_limit:
+            target = self.target
+            while len(self._queue) < target and gather_count < self.gather_limit:
+                if not self._within_budget():
+                    self.budget_exhausted += 1
+                    break
                 gather_count += 1
-                values = await self.gather()
+                values = await self._gather_timed()
                 self._queue.extend(values)
+                self._pushed.extend(values)
 
             # Send an error if failed to fill queue after reaching maximum attempts
-            if len(self._queue) < self.fill_size:
+            if len(self._queue) < target and gather_count >= self.gather_limit:
                 print("Exceeded gather attempts")
                 await utils.report(self.bot,
                                    f"Failed to fill ResourceCache `{self.cache_id}`\n"
                                    f"Attempts: {gather_count}\n"
                                    f"Queue size: {len(self._queue)}\n"
-                                   f"Target: {self.fill_size}\n"
+                                   f"Target: {target}\n"
                                    f"Cache: `{', '.join(self._queue)}`")
+            elif len(self._queue) < target:
+                print(f"Cache `{self.cache_id}` is over its gather budget. Filled to {len(self._queue)}")
             else:
                 print(f"Cache `{self.cache_id}` filled!")
             self._locked = False
             self._save()
         except Exception as e:
-            self._locked = True  # Don't lock up the queue
+            self._locked = False  # Don't lock up the queue
+            self._save()
             await utils.report(self.bot, f"Exception on `_fill()` for ResourceCache `{self.cache_id}` \n" + str(e))
+
+
+class KeyedStringCache:
+    """
+    A group of StringCaches, one for each key (e.g. a search term), for prefetching
+    the values of the keys that are requested most
+
+    A key gets its own cache once it has been requested `promote_after` times, so
+    one-off keys don't use up the API being gathered from. Until then, `next()`
+    returns None for it, and the caller should fetch the value itself. At most
+    `max_caches` caches are kept, and the least recently used one is dropped
+    """
+
+    MAX_TRACKED_KEYS = 1000  # Request counts kept for keys without a cache
+
+    def __init__(self, bot, factory, max_caches=10, promote_after=3, preset_keys=()):
+        """
+        Creates a KeyedStringCache, and creates the caches of the preset keys
+
+        :param bot: The bot object
+        :param factory: Called as `factory(bot, key)` to create the StringCache of a key
+        :param max_caches: The most keys with a cache at once (Default: 10)
+        :param promote_after: The number of requests for a key before it gets a cache (Default: 3)
+        :param preset_keys: Keys which get a cache straight away (Default: None)
+        """
+        self.bot = bot
+        self.factory = factory
+        self.max_caches = max_caches
+        self.promote_after = promote_after
+
+        self._caches = OrderedDict()  # Maps a key to its cache, least recently used first
+        self._requests = {}  # Maps a key without a cache to the number of times it has been requested
+        for key in preset_keys:
+            self._add(key)
+
+    def __contains__(self, key):
+        return key in self._caches
+
+    def next(self, key):
+        """ Returns the next value for a key. Returns 'None' if the key has no cache yet, or its cache is empty """
+        cache = self._caches.get(key)
+        if cache is not None:
+            self._caches.move_to_end(key)
+            return cache.next()
+
+        self._requests[key] = self._requests.get(key, 0) + 1
+        if self._requests[key] >= self.promote_after:
+            del self._requests[key]
+            self._add(key)
+        elif len(self._requests) > KeyedStringCache.MAX_TRACKED_KEYS:
+            self._requests.clear()
+        return None
+
+    def _add(self, key):
+        """ Creates a key's cache, dropping the least recently used cache if there are too many """
+        self._caches[key] = self.factory(self.bot, key)
+        while len(self._caches) > self.max_caches:
+            (_, dropped) = self._caches.popitem(last=False)
+            StringCache.caches.pop(dropped.cache_id, None)
+
+
+class DailyCache:
+    """
+    Holds a single value which changes once a day (e.g. a picture of the day).
+    The value is fetched the first time it is requested each day, and served
+    from memory for the rest of the day. The task of fetching the value is defined
+    by the `fetch()` function, which has no default implementation and must be
+    defined for every application of this class.
+    """
+
+    def __init__(self, tz=timezone.utc, retry_seconds=10 * 60):
+        """
+        Creates an empty DailyCache
+
+        :param tz: The time zone (a tzinfo) whose midnight the value changes at (Default: UTC)
+        :param retry_seconds: How long to wait before fetching again when `is_current()`
+            says the fetched value is still the previous day's (Default: 600)
+        """
+        self.tz = tz
+        self.retry_seconds = retry_seconds
+        self.value = None
+        self.day = None  # The day the value is current for
+        self._retry_time = 0
+        self._fetching = SingleFlight()
+
+    def today(self):
+        """ Returns the current date in the cache's time zone """
+        return datetime.now(self.tz).date()
+
+    async def get(self):
+        """ Returns the day's value, fetching it if it hasn't been fetched today """
+        today = self.today()
+        if self.day == today or (self.value is not None and time.monotonic() < self._retry_time):
+            return self.value
+        return await self._fetching.do(today, self._refresh, today)
+
+    async def fetch(self):
+        """
+        This is the method which defines the logic by which the value is acquired
+        :return: The day's value
+        """
+        raise NotImplementedError
+
+    def is_current(self, value, day) -> bool:
+        """
+        Checks whether a fetched value is the value of a day, for sources which
+        don't change at exactly midnight. By default, every value is current
+        :return: True if the value is the day's value
+        """
+        return True
+
+    async def _refresh(self, today):
+        """ Fetches the value and records the day it is current for """
+        value = await self.fetch()
+        self.value = value
+        if self.is_current(value, today):
+            self.day = today
+        else:
+            self._retry_time = time.monotonic() + self.retry_seconds
+        return value
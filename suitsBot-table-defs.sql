@@ -28,6 +28,30 @@ CREATE TABLE `Cache` (
 ) ENGINE=InnoDB DEFAULT CHARSET=latin1;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
+--
+-- Table structure for table `CommandWhitelist`
+--
+
+DROP TABLE IF EXISTS `CommandWhitelist`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!40101 SET character_set_client = utf8 */;
+CREATE TABLE `CommandWhitelist` (
+  `Server` char(18) NOT NULL,
+  `Command` varchar(20) NOT NULL,
+  PRIMARY KEY (`Server`,`Command`)
+) ENGINE=InnoDB DEFAULT CHARSET=latin1;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `CommandWhitelist`
+--
+
+LOCK TABLES `CommandWhitelist` WRITE;
+/*!40000 ALTER TABLE `CommandWhitelist` DISABLE KEYS */;
+INSERT INTO `CommandWhitelist` VALUES ('360523650912223253','code'),('360523650912223253','dev'),('360523650912223253','gritty'),('360523650912223253','help'),('360523650912223253','meow'),('360523650912223253','nasa'),('360523650912223253','on'),('360523650912223253','rand'),('360523650912223253','rssfeed'),('360523650912223253','ud'),('360523650912223253','wiki'),('360523650912223253','wm'),('360523650912223253','wolf'),('360523650912223253','woof'),('360523650912223253','youtube');
+/*!40000 ALTER TABLE `CommandWhitelist` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Table structure for table `ListDetails`
 --
@@ -126,7 +150,8 @@ DROP TABLE IF EXISTS `Users`;
 /*!40101 SET character_set_client = utf8 */;
 CREATE TABLE `Users` (
   `ID` char(18) NOT NULL,
-  `Name` varchar(32) DEFAULT NULL
+  `Name` varchar(32) DEFAULT NULL,
+  PRIMARY KEY (`ID`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 /*!40101 SET character_set_client = @saved_cs_client */;
 /*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 # ----------- For core functionality
+import asyncio
 import discord
 from discord.ext import commands
 from discord import Embed
@@ -11,10 +12,18 @@ from credentials import tokens
 import embedGenerator
 from scheduler import Scheduler
 from dbconnection import DBConnection
+from writequeue import WriteQueue
+from pipeline import MessagePipeline
+from userregistry import UserRegistry
+from reporting import ReportAggregator
 from constants import *
 from local_config import *
 import utils
 import parse
+import redisconnection
+import responsecache
+from stringcache import StringCache
+import webclient
 from cogs import images
 from utils import embedfromdict
 
@@ -25,21 +34,17 @@ scribble_bank = list()
 
 # -------------------- COMMAND WHITELIST -------------------------------
 
-command_whitelist = {"360523650912223253": ["help",
-                                            "code",
-                                            "dev",
-                                            "gritty",
-                                            "nasa",
-                                            "meow",
-                                            "on",
-                                            "rand",
-                                            "rssfeed",
-                                            "ud",
-                                            "wiki",
-                                            "wm",
-                                            "wolf",
-                                            "woof",
-                                            "youtube"]}
+# Servers which only allow some commands, loaded from the CommandWhitelist table
+command_whitelist = {}  # Maps a server id to the set of commands it allows
+whitelisted_aliases = {}  # Maps a server id to every name its allowed commands can be invoked with
+
+
+def whitelist_aliases(allowed_commands):
+    """ Expands a server's whitelisted commands into the frozenset of every alias they can be invoked with """
+    aliases = set(allowed_commands)
+    for allowed_command in allowed_commands:
+        aliases.update(ALIASES.get(allowed_command, []))
+    return frozenset(aliases)
 
 # ------------------------ DEFINE BOT ----------------------------------
 
@@ -215,20 +220,6 @@ async def on_ready():
 
         bot.regex = parse.Regex(bot)
 
-        print('Scheduling tasks...')
-
-        try:
-            # Update restart embed
-            ready_embed.remove_field(status_field)
-            ready_embed.add_field(name="Status", value="Scheduling tasks...", inline=False)
-            await bot.edit_message(ready_message, embed=ready_embed)
-
-            bot.scheduler = Scheduler(bot)
-            bot.scheduler.add_daily_task(post_apod)
-
-        except Exception as e:
-            await utils.report(bot, str(e), source="Failed to start scheduler")
-
         print('Finalizing setup...')
 
         # Load/initialize web content
@@ -262,7 +253,13 @@ async def on_message(message):
         # THE BOT WILL NOT BE ABLE TO RESTART
         if message.content == "!r":
             if message.author.id in AUTHORIZED_IDS:
-                bot.dbconn.close()
+                bot.pipeline.close()
+                bot.user_registry.close()  # Queue any users who haven't been written yet
+                await bot.write_queue.close()  # Commit any queued database writes
+                await bot.dbconn.close()
+                await webclient.client.close()
+                await redisconnection.close()
+                await bot.reporter.close()  # Send any waiting error reports
                 if bot.is_voice_connected(message.server):
                     await bot.voice_client_in(message.server).disconnect()  # Disconnect from voice
                 await bot.send_message(message.channel, "Restarting...")
@@ -277,20 +274,32 @@ async def on_message(message):
         if message.content[:3].lower() == "-sb":
             return
 
+        # ------------------------------------------- QUEUE FOR PROCESSING
+        # Everything else is handled by the message pipeline's workers
+        prefixes = get_prefix(bot, message)
+        is_command = message.content.startswith(tuple(prefixes) if isinstance(prefixes, list) else prefixes)
+        await bot.pipeline.submit(message, is_command=is_command)
+    except Exception as e:
+        await utils.report(bot, str(e), source="on_message")
+
+
+async def process_message(message, shed_unfurls=False):
+    """
+    Handles a message queued by on_message. Run by the message pipeline's workers.
+    Commands are run afterwards by the pipeline, in their own tasks
+
+    :param message: The message
+    :param shed_unfurls: If True, the pipeline is backed up and links in the message are not unfurled
+    :return: True if the message may be run as a command
+    """
+    try:
         # ------------------------------------------- LIST ENGINE
         # Add author to user table and ListEngine if missing
         authorid = message.author.id
         authorname = message.author.name
-        # If user missing from user table
+        # If user missing from user table. New users are written to the database in batches
         try:
-            if authorid not in bot.users.keys() and "users" not in bot.loading_failure.keys():
-                sqlname = ''
-                for char in authorname:
-                    if char.lower() in "abcdefghijklmnopqrstuvwxyz1234567890 ?\\/\'\",.[]\{\}|!@#$%^&*()`~":
-                        sqlname += char
-                    else:
-                        sqlname += '?'
-                add_user(authorid, sqlname)
+            if "users" not in bot.loading_failure.keys() and bot.user_registry.add(authorid, authorname):
                 await utils.flag(bot,
                                  "Added new user on server",
                                  description=str(authorid) + ":" + message.author.name,
@@ -298,22 +307,7 @@ async def on_message(message):
         except Exception as e:
             await utils.report(bot,
                                str(e),
-                               source=f"Failed to add user `{authorname}` to server {message.server.id}, tried with {sqlname}")
-
-        # If user missing from list engine
-        if authorid not in bot.list_engine.user_table.keys():
-            bot.list_engine.add_user(authorid)
-            await utils.flag(bot,
-                             "Added user to list engine",
-                             description=str(authorid) + ":" + message.author.name,
-                             message=message)
-        # If user missing bestgirl list
-        if "BestGirl" not in bot.list_engine.user_table[authorid].keys():
-            bot.list_engine.create_list(authorid, "BestGirl")
-            await utils.flag(bot,
-                             "Added missing BestGirl list to user",
-                             description=str(authorid) + ":" + message.author.name,
-                             message=message)
+                               source=f"Failed to add user `{authorname}` to server {message.server.id}")
 
         # ------------------------------------------- RESPOND TO EMOJI
         if message.content in ["🖐", "✋", "🤚"]:
@@ -332,7 +326,7 @@ async def on_message(message):
             await bot.send_message(message.channel, utils.random_element(thanks))
 
         # ------------------------------------------- FILTER UN-WHITELISTED COMMANDS
-        if message.server is not None and message.server.id in command_whitelist:
+        if message.server is not None and message.server.id in whitelisted_aliases:
             if len(message.content) > 1 and message.content[0] == "!":
                 spaceloc = message.content.find(" ", 2)
                 if spaceloc > -1:
@@ -340,63 +334,57 @@ async def on_message(message):
                 else:
                     command = message.content[1:]
 
-                aliaslist = []
-                for allowedCommand in command_whitelist[message.server.id]:
-                    aliaslist.append(allowedCommand)
-                    if allowedCommand in ALIASES:
-                        for alias in ALIASES[allowedCommand]:
-                            aliaslist.append(alias)
-
-                if command not in aliaslist:
+                if command not in whitelisted_aliases[message.server.id]:
                     return
 
         # -------------------------------------------- Embed response detection
         content = message.content
 
-        # Subreddits
-        sublist = []
-        matches = bot.regex.find_subreddits(content)
-        for match in matches:
-            sub = match[0].strip()  # Get the full match from the regex tuple
-            subname = sub[sub.find("r/") + 2:]  # strip off "/r/"
-            if subname not in sublist:  # Check for duplicates
-                if await embedGenerator.recently_unfurled(f"{message.channel.id}-subreddits-{subname}"):
+        try:
+            unfurls = []  # (dedupe key, link, embed method) for every link, in the order they're posted
+            links = {} if shed_unfurls else bot.regex.scan(content)
+
+            # Subreddits
+            for match in links.get("subreddit", []):
+                sub = match[0].strip()  # Get the full match from the regex tuple
+                subname = sub[sub.find("r/") + 2:]  # strip off "/r/"
+                unfurls.append((f"{message.channel.id}-subreddits-{subname}", subname, embedGenerator.subreddit))
+
+            generator_fodder = [("post", embedGenerator.reddit_post),  # Reddit posts
+                                ("comment", embedGenerator.reddit_comment),  # Reddit comments
+                                # ("twitter_id", embedGenerator.twitter_images),  # Images from tweets
+                                ("twitter_id", embedGenerator.twitter_response),  # Response to tweets
+                                ("amazon", embedGenerator.amazon),  # Amazon links
+                                ("newegg", embedGenerator.newegg)]  # Newegg links
+
+            for (kind, generator) in generator_fodder:
+                for match in links.get(kind, []):
+                    link = match.strip()
+                    unfurls.append((f"{message.channel.id}-{generator.__name__}-{link}", link, generator))
+
+            # Fetch every link at once, but post the embeds in link order
+            unfurl_messages = []
+            for (unfurl, result) in zip(unfurls, await embedGenerator.generate_embeds(unfurls)):
+                if isinstance(result, Exception):
+                    await utils.report(bot, f"{result}\nLink: {unfurl[1]}", source="embed generation in on_message")
                     continue
-                sublist.append(subname)
-                subembed = None
-                try:
-                    subembed = await embedGenerator.subreddit(subname)
-                    if subembed is not None:
-                        unfurl_message = await bot.send_message(message.channel, embed=subembed)
-                        await embedGenerator.record_unfurl(message, unfurl_message)
-                        await bot.add_reaction(unfurl_message, DELETE_EMOJI)
-                except Exception as e:
-                    details = {} if subembed is None else subembed.to_dict()
-                    await utils.report(bot, str(e) + "\n" + str(details), source='subreddit detection')
+                for embed in result:
+                    unfurl_messages.append(await bot.send_message(message.channel, embed=embed))
 
-        try:
-            generator_fodder = [(bot.regex.find_posts, embedGenerator.reddit_post),  # Reddit posts
-                                (bot.regex.find_comments, embedGenerator.reddit_comment),  # Reddit comments
-                                # (bot.regex.find_twitter_handle, embedGenerator.twitter_handle),  # Twitter handles
-                                # (bot.regex.find_twitter_id, embedGenerator.twitter_images),  # Images from tweets
-                                (bot.regex.find_twitter_id, embedGenerator.twitter_response),  # Response to tweets
-                                (bot.regex.find_amazon, embedGenerator.amazon),  # Amazon links
-                                (bot.regex.find_newegg, embedGenerator.newegg)]  # Newegg links
-
-            for (regex, generator) in generator_fodder:
-                for embed in await embedGenerator.embeds_from_regex(regex(content), generator, message):
-                    unfurl_message = await bot.send_message(message.channel, embed=embed)
-                    await embedGenerator.record_unfurl(message, unfurl_message)
-                    await bot.add_reaction(unfurl_message, DELETE_EMOJI)
+            # Then track them and add their delete reactions together
+            await asyncio.gather(*[embedGenerator.record_unfurl(message, unfurl_message)
+                                   for unfurl_message in unfurl_messages],
+                                 *[bot.add_reaction(unfurl_message, DELETE_EMOJI)
+                                   for unfurl_message in unfurl_messages])
 
         except Exception as e:
             await utils.report(bot, str(e), source="embed generation in on_message")
 
         # ------------------------------------------------------------
 
-        await bot.process_commands(message)
+        return True
     except Exception as e:
-        await utils.report(bot, str(e), source="on_message")
+        await utils.report(bot, str(e), source="process_message")
 
 
 # ------------------------ GENERAL COMMANDS ---------------------------------
@@ -461,18 +449,35 @@ async def dev(ctx):
             title = "`!dev` User Guide"
             description = "A list of features useful for "
             helpdict = {
+                "cache": ("Shows the statistics of the web response cache and the string caches. " +
+                          "`!dev cache clear` empties the web response cache"),
                 "channelid": "Posts the ID of the current channel",
                 "dump": "A debug command for the bot to dump a variable into chat",
                 "flag": "Tests the `flag` function",
                 "load": "Loads an extension",
+                "pipeline": "Shows the message pipeline's queue depth, throughput and wait times",
                 "playing": "Sets the presence of the bot (what the bot says it's currently playing)",
                 "reload": "Reloads an extension",
                 "report": "Tests the `report` function",
                 "serverid": "Posts the ID of the current channel",
                 "test": "A catch-all command for inserting code into the bot to test",
+                "whitelist": ("Shows the commands allowed on this server. `!dev whitelist add <command>` and " +
+                              "`!dev whitelist remove <command>` change them. Servers without a whitelist " +
+                              "allow every command"),
             }
             await bot.say("`!dev` User Guide", embed=embedfromdict(helpdict, title=title, description=description))
 
+        elif func == "cache":
+            if parameter == "clear":
+                responsecache.cache.clear()
+                await bot.say("Web response cache cleared")
+                return
+            cache_stats = responsecache.cache.stats()
+            cache_stats["Coalesced requests"] = str(utils.get_requests_in_flight.coalesced)
+            await bot.say(embed=embedfromdict(cache_stats, title="Web Response Cache"))
+            for (cache_id, string_cache) in StringCache.caches.items():
+                await bot.say(embed=embedfromdict(string_cache.stats(), title=f"String Cache `{cache_id}`"))
+
         elif func == "channelid":
             await bot.say("Channel ID: " + ctx.message.channel.id)
 
@@ -508,11 +513,14 @@ async def dev(ctx):
             except Exception as e:
                 await utils.report(bot, str(e), source="!dev nick", ctx=ctx)
 
+        elif func == "pipeline":
+            await bot.say(embed=embedfromdict(bot.pipeline.stats(), title="Message Pipeline"))
+
         elif func == "playing":
             try:
                 currently_playing = parameter
                 await bot.change_presence(game=discord.Game(name=currently_playing))
-                utils.update_cache(bot.dbconn, "currPlaying", currently_playing)
+                utils.update_cache(bot.write_queue, "currPlaying", currently_playing)
                 await bot.say("I'm now playing `" + parameter + "`")
             except discord.InvalidArgument as e:
                 await utils.report(bot,
@@ -546,6 +554,64 @@ async def dev(ctx):
             except Exception as e:
                 await utils.report(bot, str(e), source="dev test", ctx=ctx)
 
+        elif func == "whitelist":
+            if ctx.message.server is None:
+                await bot.say("I can't do that here")
+                return
+            server_id = ctx.message.server.id
+            (action, _, command_name) = parameter.partition(" ")
+            command_name = command_name.strip()
+            if command_name in bot.commands:  # The whitelist stores commands by name, not by alias
+                command_name = bot.commands[command_name].name
+            allowed = command_whitelist.get(server_id, set())
+
+            if action == "":
+                if not allowed:
+                    await bot.say("This server has no whitelist, so every command is allowed")
+                    return
+                await bot.say("Commands allowed on this server: " +
+                              ", ".join(f"`{allowed_command}`" for allowed_command in sorted(allowed)))
+
+            elif action == "add":
+                if command_name not in bot.commands:
+                    await bot.say(f"I don't have a command called `{command_name}`")
+                    return
+                if command_name in allowed:
+                    await bot.say(f"`{command_name}` is already allowed on this server")
+                    return
+                # A new whitelist always allows `dev`, so that it can still be changed
+                added = [command_name] if allowed else sorted({"dev", command_name})
+                allowed.update(added)
+                command_whitelist[server_id] = allowed
+                whitelisted_aliases[server_id] = whitelist_aliases(allowed)
+                bot.write_queue.put_group([("INSERT INTO CommandWhitelist VALUES (%s, %s)", (server_id, added_command))
+                                           for added_command in added])
+                if len(added) > 1:
+                    await bot.say(f"`{command_name}` is now allowed on this server. This server had no whitelist, " +
+                                  "so `dev` is allowed too, to keep the whitelist editable")
+                else:
+                    await bot.say(f"`{command_name}` is now allowed on this server")
+
+            elif action == "remove":
+                if command_name not in allowed:
+                    await bot.say(f"`{command_name}` isn't on this server's whitelist")
+                    return
+                if command_name == "dev":
+                    await bot.say("I can't remove `dev`, or you wouldn't be able to change the whitelist here")
+                    return
+                allowed.remove(command_name)
+                if allowed:
+                    whitelisted_aliases[server_id] = whitelist_aliases(allowed)
+                else:
+                    del command_whitelist[server_id]
+                    del whitelisted_aliases[server_id]
+                bot.write_queue.put("DELETE FROM CommandWhitelist WHERE Server=%s AND Command=%s",
+                                    (server_id, command_name))
+                await bot.say(f"`{command_name}` is no longer allowed on this server")
+
+            else:
+                await bot.say("Usage: `!dev whitelist [add|remove <command>]`")
+
         elif func == "unload":
             """ Unoads an extension """
             bot.unload_extension(parameter)
@@ -595,7 +661,7 @@ async def scribble(ctx):
             else:
                 scribble_bank.append(value)
                 added.append(value)
-        utils.update_cache(bot.dbconn, "scribble", ",".join(scribble_bank))
+        utils.update_cache(bot.write_queue, "scribble", ",".join(scribble_bank))
         if len(added) > 0:
             await bot.say("Alright, I recorded " + ", ".join([("`" + i + "`") for i in added]))
         if len(rejected) == 1:
@@ -614,64 +680,71 @@ async def ree():
 
 # ------------------- UPDATE MYSQL DB -------------------------------
 
-def add_user(user_id, username):
-    """ Adds a user to the database
-
-    Parameters
-    -------------
-    user_id : str
-        The 18 digit user id of the user
-    username : str
-        The Discord name of the user
-    """
-    bot.dbconn.ensure_sql_connection()
-    # Add user to user table
-    add_user_command = "INSERT INTO Users VALUES (%s, %s)"
-    add_user_data = (user_id, username)
-    bot.dbconn.execute(add_user_command, add_user_data)
-    bot.users[user_id] = username
-
-    # Add the user to the list engine
-    bot.list_engine.add_user(user_id)
-
-    bot.dbconn.commit()
-
-
 # --------------------- LOADING DB ----------------------------------
 
 
-def load():
+async def load():
     """ Load everything """
-    loadusers()
-    loadcache()
+    await loadusers()
+    await loadcache()
+    await loadwhitelist()
 
 
-def loadusers():
+async def loadusers():
     """ Load user table from database """
     try:
-        bot.users = {}
-        query = "SELECT * FROM Users"
-        cursor = bot.dbconn.execute(query)
-        for (ID, Name) in cursor:
-            bot.users[ID] = Name
+        await bot.user_registry.load()
     except Exception as e:
         bot.loading_failure["users"] = e
 
 
-def loadcache():
+async def loadcache():
     """ Load Cache values from database """
     global currently_playing, scribble_bank
     try:
-        currently_playing = utils.load_from_cache(bot.dbconn, "currPlaying", "")
-        scribble_bank = utils.load_from_cache(bot.dbconn, "scribble", "").split(',')
+        currently_playing = await utils.load_from_cache(bot.dbconn, "currPlaying", "")
+        scribble_bank = (await utils.load_from_cache(bot.dbconn, "scribble", "")).split(',')
     except Exception as e:
         bot.loading_failure["cache"] = e
 
 
+async def loadwhitelist():
+    """ Load the command whitelist from database """
+    try:
+        command_whitelist.clear()
+        query = "SELECT Server, Command FROM CommandWhitelist"
+        for (server_id, command_name) in await bot.dbconn.fetch(query):
+            command_whitelist.setdefault(server_id, set()).add(command_name)
+        whitelisted_aliases.clear()
+        for (server_id, allowed) in command_whitelist.items():
+            whitelisted_aliases[server_id] = whitelist_aliases(allowed)
+    except Exception as e:
+        bot.loading_failure["whitelist"] = e
+
+
 # -----------------------   START UP   -----------------------------------
 
-# Create MySQL connection
-bot.dbconn = DBConnection(tokens["MYSQL_USER"], tokens["MYSQL_PASSWORD"], "suitsBot")
+# Create MySQL connection pool
+bot.dbconn = DBConnection(tokens["MYSQL_USER"],
+                          tokens["MYSQL_PASSWORD"],
+                          "suitsBot",
+                          min_size=DB_POOL_MIN_SIZE,
+                          max_size=DB_POOL_MAX_SIZE,
+                          acquire_timeout=DB_ACQUIRE_TIMEOUT_SECONDS,
+                          loop=bot.loop)
+bot.write_queue = WriteQueue(bot,
+                             bot.dbconn,
+                             flush_interval=WRITE_QUEUE_FLUSH_INTERVAL_SECONDS,
+                             flush_size=WRITE_QUEUE_FLUSH_SIZE,
+                             max_attempts=WRITE_QUEUE_MAX_ATTEMPTS,
+                             max_backoff=WRITE_QUEUE_MAX_BACKOFF_SECONDS,
+                             journal_path=WRITE_QUEUE_JOURNAL_PATH)
+bot.reporter = ReportAggregator(bot,
+                                flush_interval=REPORT_FLUSH_SECONDS,
+                                max_per_minute=REPORT_MAX_PER_MINUTE,
+                                max_pending=REPORT_MAX_PENDING)
+bot.user_registry = UserRegistry(bot, bot.dbconn, bot.write_queue, flush_interval=USER_REGISTRY_FLUSH_SECONDS)
+bot.users = bot.user_registry.users
 bot.loading_failure = {}
 
 # Load opus library
@@ -681,8 +754,26 @@ if not discord.opus.is_loaded():
 print("\n\n------------")
 print('Loading Data...')
 
-# Load data from database
-load()
+# Commit any writes replayed from the journal, then load data from database
+bot.loop.run_until_complete(bot.write_queue.flush())
+bot.loop.run_until_complete(load())
+
+# Open the shared HTTP session
+bot.loop.run_until_complete(webclient.client.start())
+
+# Start the scheduler before the cogs load, so they can register their own tasks
+print("Scheduling tasks...")
+bot.scheduler = Scheduler(bot)
+bot.scheduler.add_daily_task(post_apod)
+
+# Start the workers which process incoming messages
+bot.pipeline = MessagePipeline(bot,
+                               process_message,
+                               bot.process_commands,
+                               workers=PIPELINE_WORKERS,
+                               queue_size=PIPELINE_QUEUE_SIZE,
+                               unfurl_high_water=PIPELINE_UNFURL_HIGH_WATER,
+                               command_concurrency=PIPELINE_COMMAND_CONCURRENCY)
 
 print("Loading cogs...")
 
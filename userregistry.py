@@ -0,0 +1,114 @@
+import asyncio
+import utils
+
+# The characters allowed in stored user names (compared in lowercase). Everything else is replaced with '?'
+NAME_CHARACTERS = "abcdefghijklmnopqrstuvwxyz1234567890 ?\\/'\",.[]{}|!@#$%^&*()`~"
+
+# The most users written by a single INSERT
+MAX_ROWS_PER_INSERT = 500
+
+
+class NameTable(dict):
+    """
+    A `str.translate()` table which replaces every character not in NAME_CHARACTERS with '?'
+
+    Characters are looked up the first time they are seen and remembered, so
+    sanitizing a name is a single C-level translate call
+    """
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        replacement = char if char.lower() in NAME_CHARACTERS else "?"
+        self[codepoint] = replacement
+        return replacement
+
+
+class UserRegistry:
+    """
+    The table of every user the bot has seen
+
+    New users are added to memory immediately, and written to the Users table together in a
+    single multi-row upsert every `flush_interval` seconds, so seeing a new user doesn't cost
+    a database round trip
+
+    Parameters
+    ------------
+    bot : discord.bot object
+        The bot object, used for reporting errors
+    dbconn : DBConnection
+        The connection pool users are loaded through
+    write_queue : WriteQueue
+        The queue new users are written through
+    flush_interval : Optional - float
+        The number of seconds between writes of new users (Default: 1)
+    """
+    def __init__(self, bot, dbconn, write_queue, flush_interval=1):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.users = {}  # Maps a user id to their sanitized name
+        self._dbconn = dbconn
+        self._write_queue = write_queue
+        self._pending = {}  # Users which haven't been written to the database yet
+        self._name_table = NameTable()
+        self._flush_task = bot.loop.create_task(self._flush_loop())
+
+    def __contains__(self, user_id):
+        return user_id in self.users
+
+    async def load(self):
+        """ Loads every user from the database """
+        users = {}
+        for (user_id, name) in await self._dbconn.fetch("SELECT * FROM Users"):
+            users[user_id] = name
+        users.update(self._pending)
+        self.users.clear()
+        self.users.update(users)
+
+    def sanitize(self, name):
+        """ Replaces every character in a name which can't be stored with '?' """
+        return name.translate(self._name_table)
+
+    def add(self, user_id, name):
+        """
+        Records a user if they haven't been seen before
+
+        Parameters
+        ------------
+        user_id : str
+            The 18 digit user id of the user
+        name : str
+            The Discord name of the user
+
+        Returns
+        ------------
+        bool - True if the user is new
+        """
+        if user_id in self.users:
+            return False
+        name = self.sanitize(name)
+        self.users[user_id] = name
+        self._pending[user_id] = name
+        return True
+
+    def flush(self):
+        """ Queues every new user to be written to the database in a single statement (per MAX_ROWS_PER_INSERT) """
+        pending = list(self._pending.items())
+        self._pending = {}
+        for start in range(0, len(pending), MAX_ROWS_PER_INSERT):
+            rows = pending[start:start + MAX_ROWS_PER_INSERT]
+            command = ("INSERT INTO Users (ID, Name) VALUES " + ", ".join(["(%s, %s)"] * len(rows)) +
+                       " ON DUPLICATE KEY UPDATE Name=VALUES(Name)")
+            self._write_queue.put(command, [value for row in rows for value in row])
+
+    def close(self):
+        """ Stops the flush timer and queues the remaining new users. Call this before closing the write queue """
+        self._flush_task.cancel()
+        self.flush()
+
+    async def _flush_loop(self):
+        """ Flushes new users every `flush_interval` seconds """
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                await utils.report(self.bot, str(e), source="UserRegistry flush")
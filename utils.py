@@ -1,11 +1,16 @@
-import aiohttp
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 import feedparser
 from datetime import datetime
 import random
+import sys
 import traceback
 from discord import Embed
 from local_config import *
-from constants import EMBED_COLORS
+from constants import EMBED_COLORS, RSS_PARSE_WORKERS
+import responsecache
+from singleflight import SingleFlight
+import webclient
 
 
 # ------------------------------------------------------------------------ Utilities
@@ -78,6 +83,10 @@ def first_whitespace(haystack):
 
 # ------------------------------------------------------------------------ Web functions
 
+# Concurrent identical GET requests to cacheable endpoints share one outbound request
+get_requests_in_flight = SingleFlight()
+
+
 def checkurl(regex, url):
     """
     Validates that a string is a properly formatted url
@@ -144,7 +153,7 @@ async def get_json_with_get(url, params=None, headers=None, content_type=None):
         If not provided, an empty dict is passed
     headers : dict{str:str}
         Headers passed in the request
-        If not provided, the default headers are used
+        If not provided, the default headers are used. Otherwise they are merged into the defaults
     content_type : Optional - String
         Content type of the returned json
 
@@ -163,21 +172,36 @@ async def get_json_with_get(url, params=None, headers=None, content_type=None):
     if params is None:
         params = {}
 
-    # Use default headers if none passed, otherwise
-    # add passed headers to default dictionary
-    if headers is None:
-        headers = HEADERS
-    else:
-        merged_headers = HEADERS
-        merged_headers.update(headers)
-        headers = merged_headers
-
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(url, params=params) as resp:
-            if resp.status is 200:
-                json = await resp.json(content_type=content_type)
-                return [json, 200]
-            return [None, resp.status]
+    # Serve the response from the cache if the endpoint is cacheable
+    cache = responsecache.cache
+    key = cache.key("GET", url, params)
+    ttl = cache.ttl_for(url)
+    if ttl:
+        json = await cache.get(key)
+        if json is not None:
+            return [json, 200]
+
+    # Endpoints without a cache rule (e.g. random images) must give every caller their own response
+    if not ttl:
+        return await _get_json(url, params, headers, content_type, key, ttl)
+
+    # Join the request if an identical one is already in flight
+    flight_key = (key, content_type, None if headers is None else frozenset(headers.items()))
+    result = await get_requests_in_flight.do(flight_key, _get_json, url, params, headers, content_type, key, ttl)
+    return list(result)
+
+
+async def _get_json(url, params, headers, content_type, key, ttl):
+    """ Performs the request for `get_json_with_get()` and caches a successful response """
+    # The shared session already sends the default headers,
+    # so any passed headers are merged into them
+    async with webclient.client.session.get(url, params=params, headers=headers) as resp:
+        if resp.status == 200:
+            json = await resp.json(content_type=content_type)
+            if ttl:
+                await responsecache.cache.set(key, json, ttl)
+            return [json, 200]
+        return [None, resp.status]
 
 
 async def get_json_with_post(url, params=None, headers=None, json=None):
@@ -193,7 +217,7 @@ async def get_json_with_post(url, params=None, headers=None, json=None):
         If not provided, an empty dict is passed
     headers : dict{str:str}
         Headers passed in the request
-        If not provided, the default headers are used
+        If not provided, the default headers are used. Otherwise they are merged into the defaults
     json : Optional - dict{str:str}
         The JSON dictionary to be posted with the API
 
@@ -212,23 +236,24 @@ async def get_json_with_post(url, params=None, headers=None, json=None):
     if params is None:
         params = {}
 
-    # Use default headers if none passed, otherwise
-    # add passed headers to default dictionary
-    if headers is None:
-        headers = HEADERS
-    else:
-        merged_headers = HEADERS
-        merged_headers.update(headers)
-        headers = merged_headers
-
     # Create json dictionary if none passed
     if json is None:
         json = {}
 
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.post(url, params=params, json=json) as resp:
-            json = await resp.json()
-            return [json, resp.status]
+    # Serve the response from the cache if the endpoint is cacheable
+    cache = responsecache.cache
+    ttl = cache.ttl_for(url)
+    if ttl:
+        key = cache.key("POST", url, params, json)
+        cached = await cache.get(key)
+        if cached is not None:
+            return [cached, 200]
+
+    async with webclient.client.session.post(url, params=params, headers=headers, json=json) as resp:
+        json = await resp.json()
+        if ttl and resp.status == 200:
+            await cache.set(key, json, ttl)
+        return [json, resp.status]
 
 
 async def get_website_text(url, params=None, json=None):
@@ -240,26 +265,71 @@ async def get_website_text(url, params=None, json=None):
     :param json: A JSON payload to include
     :return: The raw HTML of the web page
     """
-    async with aiohttp.ClientSession(headers=HEADERS) as session:
-        async with session.post(url, params=params, json=json) as resp:
-            if resp.status is not 200:
-                return None
-            return await resp.text()
+    async with webclient.client.session.post(url, params=params, json=json) as resp:
+        if resp.status != 200:
+            return None
+        return await resp.text()
 
 
-def get_rss_feed(url):
+# Parses feeds in separate processes, so the parsing doesn't hold the GIL
+rss_parse_pool = None
+
+
+async def get_rss_feed(url, etag=None, modified=None, transform=None):
     """
     Returns a feedparser object containing the information about the RSS feed
 
+    The feed is downloaded with the shared HTTP session and parsed in a process pool,
+    so neither blocks the event loop. If the validators from a previous fetch are passed,
+    the request is conditional. When the feed has not changed, the server answers 304
+    and nothing is downloaded or parsed
+
     :param url: (str) the url of the rss feed
-    :return: A feedparser object
+    :param etag: (str) the ETag returned by the last fetch of the feed
+    :param modified: (str) the Last-Modified date returned by the last fetch of the feed
+    :param transform: A module level function applied to the feedparser object in the parsing
+        process, e.g. to trim it down to what is used. Its result must be a dictionary
+    :return: A feedparser object (or the result of transform), with the 'status', 'etag' and
+        'modified' of the response. For a 304 response, only those three keys are present
     """
-    return feedparser.parse(url)
+    global rss_parse_pool
+
+    headers = {}
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    if modified is not None:
+        headers["If-Modified-Since"] = modified
+
+    async with webclient.client.session.get(url, headers=headers) as resp:
+        if resp.status == 304:
+            return {"status": 304, "etag": etag, "modified": modified}
+        if resp.status != 200:
+            raise RuntimeError(f"Failed to retrieve RSS feed '{url}', status code: {resp.status}")
+        content = await resp.read()
+        response_headers = {key.lower(): value for (key, value) in resp.headers.items()}
+
+    if rss_parse_pool is None:
+        rss_parse_pool = ProcessPoolExecutor(max_workers=RSS_PARSE_WORKERS)
+    rss = await asyncio.get_event_loop().run_in_executor(rss_parse_pool, _parse_rss,
+                                                         content, response_headers, transform)
+    rss["status"] = 200
+    rss["etag"] = response_headers.get("etag")
+    rss["modified"] = response_headers.get("last-modified")
+    return rss
+
+
+def _parse_rss(content, response_headers, transform):
+    """ Parses a downloaded feed. Runs in the parsing process pool """
+    rss = feedparser.parse(content, response_headers=response_headers)
+    rss.pop("bozo_exception", None)  # Exceptions can't always be pickled back to the bot's process
+    if transform is not None:
+        return transform(rss)
+    return rss
 
 
 # ------------------------------------------------------------------------ Database caching
 
-def add_to_cache(dbconn, key, value=None):
+async def add_to_cache(dbconn, key, value=None):
     """
     Add an entry to the cache
 
@@ -277,45 +347,40 @@ def add_to_cache(dbconn, key, value=None):
     ValueError - If a Cache entry already exists with the provided key
     """
 
-    dbconn.ensure_sql_connection()
-
-    # Check if key is already in use
-    select_command = "SELECT * FROM Cache WHERE ID=%s"
-    select_data = (key,)
-    cursor = dbconn.execute(select_command, select_data)
-    if cursor.rowcount > 0:
-        raise ValueError("Entry already exists for key " + key)
-
-    # Add key
-    cache_command = "INSERT INTO Cache VALUES (%s, %s)"
-    cache_data = (key, value)
-    dbconn.execute(cache_command, cache_data)
-    dbconn.commit()
+    async with dbconn.transaction() as transaction:
+        # Check if key is already in use
+        select_command = "SELECT * FROM Cache WHERE ID=%s"
+        select_data = (key,)
+        if await transaction.fetch(select_command, select_data):
+            raise ValueError("Entry already exists for key " + key)
+
+        # Add key
+        cache_command = "INSERT INTO Cache VALUES (%s, %s)"
+        cache_data = (key, value)
+        await transaction.execute(cache_command, cache_data)
     return None
 
 
-def update_cache(dbconn, key, value):
+def update_cache(write_queue, key, value):
     """
-    Cache a value
+    Cache a value. The write is queued and committed in the background
 
     Parameters
     -------------
-    dbconn : DBConnection
-        A database connection object
+    write_queue : WriteQueue
+        The queue for database writes
     key : str
         The cache key
     value : str
         The value to store
     """
 
-    dbconn.ensure_sql_connection()
     cache_command = "UPDATE Cache SET Value=%s WHERE ID=%s"
     cache_data = (value, key)
-    dbconn.execute(cache_command, cache_data)
-    dbconn.commit()
+    write_queue.put(cache_command, cache_data)
 
 
-def load_from_cache(dbconn, key, default=None):
+async def load_from_cache(dbconn, key, default=None):
     """
     Load a cache values from database
 
@@ -336,11 +401,10 @@ def load_from_cache(dbconn, key, default=None):
 
     query = "SELECT * FROM Cache WHERE ID=%s"
     data = key,
-    cursor = dbconn.execute(query, data)
-    row = cursor.fetchone()
-    if row is None:
+    rows = await dbconn.fetch(query, data)
+    if not rows:
         return default
-    return row[1].decode("utf-8")
+    return rows[0][1].decode("utf-8")
 
 
 # ------------------------------------------------------------------------ Error messages
@@ -367,9 +431,10 @@ async def flag(bot, alert, description=None, ctx=None, message=None):
         if message is None:
             if ctx is None:
                 if description is None:
-                    await bot.send_message(bot.ALERT_CHANNEL, "----\n**Alert:\n" + alert + "**")
+                    await send_report(bot, "ALERT_CHANNEL", ("flag", alert), content="----\n**Alert:\n" + alert + "**")
                 else:
-                    await bot.send_message(bot.ALERT_CHANNEL, "Alert:\n" + alert + "\n---\n" + description)
+                    await send_report(bot, "ALERT_CHANNEL", ("flag", alert),
+                                      content="Alert:\n" + alert + "\n---\n" + description)
                 return
             message = ctx.message
 
@@ -390,7 +455,7 @@ async def flag(bot, alert, description=None, ctx=None, message=None):
 
         if description is not None:
             flag_embed.description = trimtolength(description, 2048)
-        await bot.send_message(bot.ALERT_CHANNEL, embed=flag_embed)
+        await send_report(bot, "ALERT_CHANNEL", ("flag", alert), embed=flag_embed)
     except Exception as e:
         await report(bot,
                      str(e) + "\n\nAlert:\n" + alert + "\nDescription:\n" + trimtolength(description, 2000),
@@ -405,7 +470,8 @@ async def report(bot, alert, source=None, ctx=None):
     When report is called, an embed will be posted in the error-messages
     channel on the dev server. It will print out all relevant details
     including the alert message, the stack trace, and the exception
-    This embed is not returned, it is sent immediately
+    This embed is not returned. It is sent by the bot's report aggregator,
+    which coalesces repeats of the same source and exception type
 
     Parameters
     -------------
@@ -418,6 +484,9 @@ async def report(bot, alert, source=None, ctx=None):
     ctx : Optional - context object
         The context object of the message which triggered the flag
     """
+    exception_type = sys.exc_info()[0]
+    fingerprint = ("report", source, None if exception_type is None else exception_type.__name__)
+
     error_embed = Embed()
     if ctx is None:
         error_embed.title = "Alert"
@@ -425,7 +494,7 @@ async def report(bot, alert, source=None, ctx=None):
         error_embed.add_field(name="Alert", value=alert, inline=False)
         if source is not None:
             error_embed.add_field(name="Source", value=source, inline=False)
-        await bot.send_message(bot.ERROR_CHANNEL, embed=error_embed)
+        await send_report(bot, "ERROR_CHANNEL", fingerprint, embed=error_embed)
         return
     error_embed.title = "ERROR REPORT"
     error_embed.colour = EMBED_COLORS["error"]
@@ -447,7 +516,32 @@ async def report(bot, alert, source=None, ctx=None):
     error_message = "```" + trimtolength(error_message, 2042) + "```"
     error_embed.description = error_message
 
-    await bot.send_message(bot.ERROR_CHANNEL, embed=error_embed)
+    await send_report(bot, "ERROR_CHANNEL", fingerprint, embed=error_embed)
+
+
+async def send_report(bot, channel, fingerprint, content=None, embed=None):
+    """
+    Sends a report or alert through the bot's report aggregator, or
+    straight to the channel if the aggregator hasn't been created
+
+    Parameters
+    -------------
+    bot : discord.bot object
+        The bot object for sending the message
+    channel : str
+        The name of the bot attribute holding the channel (e.g. "ERROR_CHANNEL")
+    fingerprint : Hashable
+        Identifies repeats of the same report, which are coalesced
+    content : Optional - str
+        The text of the message
+    embed : Optional - Embed
+        The embed of the message
+    """
+    reporter = getattr(bot, "reporter", None)
+    if reporter is None:
+        await bot.send_message(getattr(bot, channel), content, embed=embed)
+        return
+    reporter.submit(channel, fingerprint, content=content, embed=embed)
 
 
 # ------------------------------------------------------------------------ HTML Processing
@@ -0,0 +1,66 @@
+import aiohttp
+from constants import *
+from local_config import HEADERS
+
+
+class WebClient:
+    """
+    The bot's shared HTTP client
+
+    Holds a single long-lived aiohttp ClientSession, so requests reuse pooled keep-alive
+    connections and cached DNS lookups instead of paying for a new handshake every time.
+    The session is created by `start()` (or lazily by the first request) and must be closed
+    with `close()` when the bot shuts down
+
+    Parameters
+    ------------
+    limit : Optional - int
+        The maximum number of open connections (Default: 100)
+    limit_per_host : Optional - int
+        The maximum number of open connections to a single host (Default: 10)
+    dns_cache_ttl : Optional - int
+        How many seconds DNS lookups are cached for (Default: 300)
+    keepalive_timeout : Optional - float
+        How many seconds an idle connection is kept open for reuse (Default: 30)
+    timeout : Optional - float
+        The total number of seconds a request can take (Default: 30)
+    """
+    def __init__(self, limit=100, limit_per_host=10, dns_cache_ttl=300, keepalive_timeout=30, timeout=30):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self._session = None
+
+    @property
+    def session(self):
+        """ The shared ClientSession. Created on first use if `start()` was never called """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit,
+                                             limit_per_host=self.limit_per_host,
+                                             use_dns_cache=True,
+                                             ttl_dns_cache=self.dns_cache_ttl,
+                                             keepalive_timeout=self.keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  headers=HEADERS,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._session
+
+    async def start(self):
+        """ Opens the shared session """
+        return self.session
+
+    async def close(self):
+        """ Closes the shared session and every pooled connection """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+# The client every web request is made through
+client = WebClient(limit=HTTP_POOL_LIMIT,
+                   limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+                   dns_cache_ttl=HTTP_DNS_CACHE_SECONDS,
+                   keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+                   timeout=HTTP_TIMEOUT_SECONDS)
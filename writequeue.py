@@ -0,0 +1,284 @@
+import asyncio
+from collections import deque
+import json
+import mysql.connector
+import os
+import utils
+
+# Errors caused by the statement itself. Retrying these won't help, so they count towards `max_attempts`
+STATEMENT_ERRORS = (mysql.connector.ProgrammingError, mysql.connector.IntegrityError, mysql.connector.DataError)
+
+
+class WriteQueue:
+    """
+    A write-behind queue for database mutations
+
+    Commands are not executed when they are submitted. They are appended to an in-memory
+    queue (and, optionally, an on-disk journal) and flushed to the database in grouped
+    transactions, either every `flush_interval` seconds or as soon as `flush_size` operations
+    are waiting. This keeps the commit out of the time it takes a command to reply.
+
+    Operations are always committed in the order they were submitted. If a batch fails, its
+    operations are retried one at a time so a single bad command cannot hold up the rest
+    forever; an operation whose statements fail `max_attempts` times is dropped and reported.
+    Any other failure (e.g. the database being unreachable) drops nothing: the queue backs
+    off, doubling the wait between flushes up to `max_backoff` seconds, and retries until
+    the database is back.
+
+    Parameters
+    ------------
+    bot : discord.bot object
+        The bot object, used for reporting errors
+    dbconn : DBConnection
+        The connection pool the operations are committed through
+    flush_interval : Optional - float
+        The number of seconds between flushes (Default: 0.5)
+    flush_size : Optional - int
+        The number of queued operations which triggers an immediate flush. Also the
+        maximum number of operations committed in one transaction (Default: 50)
+    max_attempts : Optional - int
+        How many times an operation's statements can fail before it is dropped (Default: 5)
+    max_backoff : Optional - float
+        The longest wait between flushes while the database can't be reached (Default: 60)
+    journal_path : Optional - str
+        A file to journal queued operations to. Journaled operations which had not been
+        committed when the bot stopped are replayed when the queue is next created.
+        If None, operations are only held in memory (Default: None)
+    """
+
+    def __init__(self, bot, dbconn, flush_interval=0.5, flush_size=50, max_attempts=5, max_backoff=60,
+                 journal_path=None):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.journal_path = journal_path
+
+        self._dbconn = dbconn
+        self._loop = bot.loop
+        self._queue = deque()  # Pending operations as [sequence number, attempts, [statement, ...]]
+        self._sequence = 0  # Sequence number of the last submitted operation
+        self._lock = asyncio.Lock()
+        self._flush_pending = False
+        self._backoff = 0  # Extra seconds to wait before the next flush, while the database can't be reached
+        self._closed = False
+
+        self._journal = None
+        self._journal_dirty = False  # If the journal has writes which have not been fsynced
+        if journal_path is not None:
+            self._replay_journal()
+            self._journal = open(journal_path, "a", encoding="utf-8")
+
+        self._flush_task = self._loop.create_task(self._flush_loop())
+
+    def __len__(self):
+        return len(self._queue)
+
+    # ===============================================================  Submitting
+
+    def put(self, command, data=None):
+        """
+        Queue a single SQL command
+
+        Parameters
+        ------------
+        command : String
+            A string containing the command to execute. Uses the '%s' syntax of `DBConnection.execute()`
+        data : (String/Int)
+            A tuple containing the data values
+        """
+        self.put_group([(command, data)])
+
+    def put_many(self, command, rows):
+        """
+        Queue an SQL command which is executed once for every row of data, with `executemany()`.
+        For an INSERT, the rows are sent to the database in a single statement
+
+        Parameters
+        ------------
+        command : String
+            A string containing the command to execute. Uses the '%s' syntax of `DBConnection.execute()`
+        rows : [(String/Int)]
+            A list of tuples of data values
+        """
+        if rows:
+            self.put_group([(command, rows, True)])
+
+    def put_group(self, statements):
+        """
+        Queue a group of SQL commands as one operation.
+        The commands are always committed together, in order
+
+        Parameters
+        ------------
+        statements : [(String, tuple)]
+            A list of (command, data) pairs. None entries are skipped. A (command, rows, True)
+            triple is executed once per row, as with `put_many()`
+        """
+        if self._closed:
+            raise RuntimeError("The write queue is closed")
+        statements = [normalize(*statement) for statement in filter(None, statements)]
+        if not statements:
+            return
+        self._sequence += 1
+        self._queue.append([self._sequence, 0, statements])
+        self._journal_write({"seq": self._sequence, "ops": statements})
+
+        if len(self._queue) >= self.flush_size and not self._flush_pending and not self._backoff:
+            self._flush_pending = True
+            self._loop.create_task(self.flush())
+
+    # ===============================================================  Flushing
+
+    async def flush(self):
+        """ Commits every queued operation to the database """
+        async with self._lock:
+            self._flush_pending = False
+            await self._sync_journal()
+            while self._queue:
+                batch = [self._queue[i] for i in range(min(self.flush_size, len(self._queue)))]
+                try:
+                    await self._commit(batch)
+                except Exception:
+                    # Find the failing operation by committing the batch one operation at a time
+                    if not await self._commit_individually(batch):
+                        return
+                    continue
+                self._backoff = 0
+                for _ in batch:
+                    self._queue.popleft()
+                self._journal_write({"committed": batch[-1][0]})
+            self._journal_truncate()
+
+    async def close(self):
+        """
+        Flushes the remaining operations and stops the queue. Call this before shutting down.
+        Operations which can't be committed (e.g. because the database is down) are reported,
+        and replayed from the journal, if there is one, when the queue is next created
+        """
+        self._closed = True
+        # Stops the timer. A flush it started runs to completion, and the flush below waits for it
+        self._flush_task.cancel()
+        await self.flush()
+        if self._queue:
+            fate = "kept in the journal" if self._journal is not None else "lost"
+            await utils.report(self.bot,
+                               f"{len(self._queue)} queued database writes could not be committed "
+                               f"before shutting down, and were {fate}",
+                               source="WriteQueue close")
+        if self._journal is not None:
+            await self._sync_journal()
+            self._journal.close()
+            self._journal = None
+
+    async def _flush_loop(self):
+        """ Flushes the queue every `flush_interval` seconds """
+        while not self._closed:
+            await asyncio.sleep(self.flush_interval + self._backoff)
+            try:
+                # Shielded so that close() can't interrupt a commit
+                await asyncio.shield(self.flush())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await utils.report(self.bot, str(e), source="WriteQueue flush")
+
+    async def _commit(self, batch):
+        """ Commits a batch of operations in one transaction """
+        async with self._dbconn.transaction() as transaction:
+            for (_, _, statements) in batch:
+                for statement in statements:
+                    if len(statement) == 3:
+                        await transaction.executemany(statement[0], statement[1])
+                    else:
+                        await transaction.execute(statement[0], statement[1])
+
+    async def _commit_individually(self, batch):
+        """
+        Commits the operations of a failed batch in their own transactions, in order.
+        An operation whose statements keep failing is dropped after `max_attempts` tries.
+        Any other failure backs the queue off without counting an attempt
+
+        Returns
+        ------------
+        bool - True if the whole batch was handled, False if an operation
+        failed and must be retried on the next flush
+        """
+        for operation in batch:
+            try:
+                await self._commit([operation])
+            except STATEMENT_ERRORS as e:
+                operation[1] += 1
+                if operation[1] < self.max_attempts:
+                    return False
+                await utils.report(self.bot,
+                                   f"Dropped a database write after {operation[1]} failed attempts\n"
+                                   f"Error: {e}\n"
+                                   f"Statements: `{operation[2]}`",
+                                   source="WriteQueue")
+            except Exception:
+                self._backoff = min(max(2 * self._backoff, self.flush_interval), self.max_backoff)
+                return False
+            self._backoff = 0
+            self._queue.popleft()
+            self._journal_write({"committed": operation[0]})
+        return True
+
+    # ===============================================================  Journal
+
+    def _journal_write(self, record):
+        """ Appends a record to the journal. It is fsynced in batches when the queue is flushed """
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal_dirty = True
+
+    async def _sync_journal(self):
+        """ Forces every journal write to disk """
+        if self._journal is None or not self._journal_dirty:
+            return
+        self._journal_dirty = False
+        self._journal.flush()
+        await self._loop.run_in_executor(None, os.fsync, self._journal.fileno())
+
+    def _journal_truncate(self):
+        """ Empties the journal once every operation in it has been committed """
+        if self._journal is None or self._queue:
+            return
+        self._journal.seek(0)
+        self._journal.truncate()
+        self._journal_dirty = False
+
+    def _replay_journal(self):
+        """ Queues every journaled operation which was not committed before the bot stopped """
+        if not os.path.exists(self.journal_path):
+            return
+        operations = []
+        committed = 0
+        with open(self.journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # A partial line from a crash mid-write
+                if "committed" in record:
+                    committed = max(committed, record["committed"])
+                else:
+                    operations.append(record)
+        for record in operations:
+            if record["seq"] > committed:
+                self._sequence += 1
+                statements = [normalize(*statement) for statement in record["ops"]]
+                self._queue.append([self._sequence, 0, statements])
+        # Rewrite the journal so it only holds the replayed operations under their new sequence numbers
+        with open(self.journal_path, "w", encoding="utf-8") as journal:
+            for (sequence, _, statements) in self._queue:
+                journal.write(json.dumps({"seq": sequence, "ops": statements}) + "\n")
+
+
+def normalize(command, data=None, many=False):
+    """ Converts a statement's data to tuples, so statements read back from the journal match the originals """
+    if many:
+        return command, [tuple(row) for row in data], True
+    return command, None if data is None else tuple(data)